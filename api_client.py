@@ -1,78 +1,228 @@
 # api_client.py
 
-import requests
+import hashlib
 import json
-from config import ATI_API_URL, GRAPHQL_URL, AUTHORIZATION_TOKEN
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import HTTPError as Urllib3HTTPError
+from config import (
+    ATI_API_URL, GRAPHQL_URL, AUTHORIZATION_TOKEN, GEOCODE_CHUNK_SIZE, GEOCODE_OFFLINE,
+    HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_MAX_RETRIES,
+    HTTP_BACKOFF_BASE, HTTP_BACKOFF_MAX, HTTP_POOL_SIZE,
+    LOTS_PAGE_SIZE, LOTS_MAX_PAGES, LOTS_MAX_PER_POLL, GRAPHQL_QUERY_VARIANT, GRAPHQL_APQ,
+    LOTS_DECODER,
+)
 from logger import logger
+from geocode_cache import geocode_cache, UNKNOWN_CITY_ID
+from models import Lot, LotsPage
+from capture import response_capture, TeeReader
+import metrics
 
-def get_city_ids(addresses):
-    headers = {
+try:
+    import orjson
+except ImportError:  # orjson опционален, без него используется json
+    orjson = None
+
+try:
+    import ijson
+    from ijson.common import ObjectBuilder
+    JSON_DECODE_ERRORS = (ValueError, ijson.JSONError)
+except ImportError:  # ijson опционален, без него ответ разбирается целиком
+    ijson = None
+    JSON_DECODE_ERRORS = (ValueError,)
+
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+AUTH_STATUS_CODES = frozenset({401, 403})
+AUTH_ERROR_CODES = frozenset({"UNAUTHENTICATED", "UNAUTHORIZED", "FORBIDDEN"})
+
+class AuthError(Exception):
+    """Сервер отклонил куки: сессию нужно обновить, а не повторять запрос."""
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def get_session(url):
+    """Возвращает общий requests.Session с пулом keep-alive соединений для хоста из url."""
+    host = urlsplit(url).netloc
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            # Куки передаются в каждый запрос явно: общий Session не должен копить Set-Cookie
+            # одного аккаунта и отправлять их с запросами другого
+            session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+            # Повторы делаем сами в request_with_retries, адаптер отвечает только за пул
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE, max_retries=0)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[host] = session
+    return session
+
+def backoff_delay(attempt):
+    """Экспоненциальная задержка с полным джиттером."""
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt))
+
+def retry_after_delay(response):
+    """Разбирает заголовок Retry-After (секунды или HTTP-дата). None, если заголовка нет."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def request_with_retries(method, url, timeout=None, max_retries=HTTP_MAX_RETRIES, **kwargs):
+    """
+    Выполняет запрос через общий Session хоста.
+    Повторяет при 5xx, 429, обрыве соединения и таймауте с экспоненциальной задержкой.
+    """
+    session = get_session(url)
+    timeout = timeout or (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+
+    for attempt in range(max_retries + 1):
+        try:
+            response = session.request(method, url, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            metrics.inc("http_errors_total", host=urlsplit(url).netloc, error=type(e).__name__)
+            if attempt == max_retries:
+                raise
+            delay = backoff_delay(attempt)
+            logger.warning("Ошибка соединения с %s: %s. Повтор через %.1f с.", url, e, delay)
+        else:
+            metrics.inc("http_responses_total", host=urlsplit(url).netloc, status=response.status_code)
+            if response.status_code not in RETRY_STATUS_CODES or attempt == max_retries:
+                return response
+            delay = retry_after_delay(response)
+            if delay is None:
+                delay = backoff_delay(attempt)
+            elif delay > HTTP_BACKOFF_MAX:
+                # Сервер просит ждать дольше, чем мы готовы блокировать цикл опроса
+                logger.warning("%s просит повторить через %.0f с. Повтор отменен.", url, delay)
+                return response
+            logger.warning("Ответ %s от %s. Повтор через %.1f с.", response.status_code, url, delay)
+            # Непрочитанный потоковый ответ иначе держит соединение пула до сборки мусора
+            response.close()
+        time.sleep(delay)
+
+@metrics.timed("ati_geocode_seconds")
+def get_city_ids(addresses, chunk_size=GEOCODE_CHUNK_SIZE):
+    """Возвращает city_id и street для адресов. Промахи кэша уходят в ATI пачками по chunk_size."""
+    unique_addresses = list(dict.fromkeys(addresses))
+
+    # Сначала берем то, что уже есть в кэше; в ATI уходят только промахи
+    city_info_mapping, missing_addresses = geocode_cache.get_many(unique_addresses)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Кэш геокодинга: %s", geocode_cache.stats())
+    if not missing_addresses:
+        logger.info("Все %s адресов найдены в кэше геокодинга.", len(unique_addresses))
+        return city_info_mapping
+    if GEOCODE_OFFLINE:
+        logger.info("Нет в кэше геокодинга: %s адресов (ATI не запрашивается).", len(missing_addresses))
+        city_info_mapping.update(unknown_city_ids(missing_addresses))
+        return city_info_mapping
+
+    for start in range(0, len(missing_addresses), chunk_size):
+        city_info_mapping.update(_fetch_city_ids(missing_addresses[start:start + chunk_size]))
+    return city_info_mapping
+
+def ati_headers():
+    return {
         "Authorization": f"Bearer {AUTHORIZATION_TOKEN}",
         "Content-Type": "application/json"
     }
-    
-    unique_addresses = list(set(addresses))
-    logger.info(f"Запрос к API с уникальными адресами: {json.dumps(unique_addresses, ensure_ascii=False)}")
+
+def unknown_city_ids(addresses):
+    return {address: {"city_id": UNKNOWN_CITY_ID, "street": None} for address in addresses}
+
+def parse_city_ids_response(data, unique_addresses):
+    """Разбирает ответ ATI parse и кладет результат в кэш геокодинга."""
+    city_info_mapping = {}
+    failed_addresses = []
+    for address in unique_addresses:
+        address_info = data.get(address, {})
+        if address_info.get('is_success'):
+            city_id = address_info.get('city_id', UNKNOWN_CITY_ID)
+            street = address_info.get('street') if address_info.get('street') else None
+            city_info_mapping[address] = {
+                "city_id": city_id,
+                "street": street
+            }
+        else:
+            city_info_mapping[address] = {
+                "city_id": UNKNOWN_CITY_ID,
+                "street": None
+            }
+            failed_addresses.append(address)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Сопоставление city_id и street: %s", json.dumps(city_info_mapping, ensure_ascii=False))
+    # Ошибки транспорта не кэшируем, только ответы ATI по конкретным адресам
+    geocode_cache.put_many(city_info_mapping, failed_addresses)
+    return city_info_mapping
+
+def _fetch_city_ids(unique_addresses):
+    logger.info("Запрос к ATI API: %s уникальных адресов.", len(unique_addresses))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Адреса запроса к ATI API: %s", json.dumps(unique_addresses, ensure_ascii=False))
 
     try:
-        response = requests.post(ATI_API_URL, headers=headers, json=unique_addresses, timeout=15)
-        logger.debug(f"Ответ от API: {response.status_code} - {response.text}")
+        response = request_with_retries("POST", ATI_API_URL, headers=ati_headers(), json=unique_addresses)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Ответ от API: %s - %s", response.status_code, response.text)
         
         if response.status_code == 200:
             data = response.json()
             logger.info("Успешный ответ от ATI API.")
-
-            city_info_mapping = {}
-            for address in unique_addresses:
-                address_info = data.get(address, {})
-                if address_info.get('is_success'):
-                    city_id = address_info.get('city_id', "Не указано")
-                    street = address_info.get('street') if address_info.get('street') else None
-                    city_info_mapping[address] = {
-                        "city_id": city_id,
-                        "street": street
-                    }
-                else:
-                    city_info_mapping[address] = {
-                        "city_id": "Не указано",
-                        "street": None
-                    }
-            logger.debug(f"Сопоставление city_id и street: {json.dumps(city_info_mapping, ensure_ascii=False, indent=4)}")
-            return city_info_mapping
+            return parse_city_ids_response(data, unique_addresses)
         else:
-            logger.error(f"Ошибка при запросе к ATI API: {response.status_code} - {response.text}")
-            return {address: {"city_id": "Не указано", "street": None} for address in unique_addresses}
+            logger.error("Ошибка при запросе к ATI API: %s - %s", response.status_code, response.text)
+            return unknown_city_ids(unique_addresses)
     except requests.RequestException as e:
-        logger.error(f"Исключение при запросе к ATI API: {e}")
-        return {address: {"city_id": "Не указано", "street": None} for address in unique_addresses}
+        logger.error("Исключение при запросе к ATI API: %s", e)
+        return unknown_city_ids(unique_addresses)
 
-def send_post_request(cookies, processed_ids):
-    headers = {
-        "Content-Type": "application/json",
+def lots_filter_input(offset=0, limit=LOTS_PAGE_SIZE, overrides=None):
+    """
+    LotsInput для BiddingsList. overrides — поля фильтра воркера; RoutesFilter
+    объединяется по ключам, Limit и Offset всегда задаются выборкой страниц.
+    """
+    lots_filter = {
+        "OnlyCurrentContractBids": False,
+        "Status": ["InBidding"],
+        "TransportTypesIDs": [],
+        "ProceduresIDs": [],
+        "Directions": [],
+        "RoutesFilter": {
+            "StartClusters": [],
+            "StartPointIDs": [],
+            "EndClusters": [],
+            "EndPointIDs": [],
+            "ReturnClusters": [],
+            "ReturnPointIDs": []
+        },
+        "WayType": "Direct"
     }
+    for key, value in (overrides or {}).items():
+        if key == "RoutesFilter":
+            lots_filter["RoutesFilter"].update(value)
+        else:
+            lots_filter[key] = value
+    return {**lots_filter, "Limit": limit, "Offset": offset}
 
-    payload = {
-        "operationName": "BiddingsList",
-        "variables": {
-            "filter": {
-                "Limit": 40,
-                "OnlyCurrentContractBids": False,
-                "Status": ["InBidding"],
-                "TransportTypesIDs": [],
-                "ProceduresIDs": [],
-                "Directions": [],
-                "RoutesFilter": {
-                    "StartClusters": [],
-                    "StartPointIDs": [],
-                    "EndClusters": [],
-                    "EndPointIDs": [],
-                    "ReturnClusters": [],
-                    "ReturnPointIDs": []
-                },
-                "WayType": "Direct"
-            }
-        },
-        "query": """query BiddingsList($filter: LotsInput!) {
+# Полный набор полей BiddingsList, как в интерфейсе tms.ozon.ru
+FULL_LOTS_QUERY = """query BiddingsList($filter: LotsInput!) {
             Lots(filter: $filter) {
                 Auction {
                     Countdown
@@ -143,17 +293,264 @@ def send_post_request(cookies, processed_ids):
             }
             __typename
         }"""
+
+# Только поля, которые читают сборка заявок, инкрементальный режим и планировщик опросов
+LEAN_LOTS_QUERY = """query BiddingsList($filter: LotsInput!) {
+            Lots(filter: $filter) {
+                ID
+                Version
+                BiddingDurationSeconds
+                Auction {
+                    Countdown
+                }
+                ProcedureInfo {
+                    ... on BiddingWithLimit {
+                        StartPrice
+                    }
+                    ... on DownBiddingWithStartPrice {
+                        StartPrice
+                        Step
+                    }
+                }
+                TransportType {
+                    ID
+                    Capacity
+                    Name
+                }
+                Route {
+                    WayPoints {
+                        ArrivalAt
+                        Point {
+                            ID
+                            Address
+                        }
+                    }
+                }
+            }
+        }"""
+
+# Текст запроса и его sha256 считаются один раз на процесс; пробелы схлопываются
+LOTS_QUERY = " ".join((FULL_LOTS_QUERY if GRAPHQL_QUERY_VARIANT == "full" else LEAN_LOTS_QUERY).split())
+LOTS_QUERY_HASH = hashlib.sha256(LOTS_QUERY.encode("utf-8")).hexdigest()
+
+class PersistedQueries:
+    """
+    Automatic Persisted Queries: запрос уходит только с sha256 текста. Если сервер хэша
+    еще не знает, запрос повторяется с полным текстом и хэшем (сервер его запоминает).
+    Если сервер APQ не поддерживает, они выключаются до конца работы процесса.
+    """
+
+    NOT_FOUND = "PersistedQueryNotFound"
+    NOT_SUPPORTED = "PersistedQueryNotSupported"
+
+    def __init__(self, enabled=GRAPHQL_APQ):
+        self.enabled = enabled
+
+    def needs_full_query(self, status_code, page):
+        """
+        Нужно ли повторить запрос, отправленный только с хэшем, с полным текстом. page — LotsPage или None.
+        Любой отказ, кроме авторизации и PersistedQueryNotFound, выключает APQ: запрос повторяется
+        с полным текстом один раз, дальнейшие запросы идут без хэша.
+        """
+        if status_code in AUTH_STATUS_CODES:
+            return False
+        errors = page.errors if page is not None else []
+        codes = {error.get("message") for error in errors} | {
+            (error.get("extensions") or {}).get("code") for error in errors
+        }
+        if status_code == 200 and (self.NOT_FOUND in codes or "PERSISTED_QUERY_NOT_FOUND" in codes):
+            metrics.inc("graphql_apq_total", result="miss")
+            return True
+        unsupported = status_code != 200 or page is None
+        unsupported = unsupported or self.NOT_SUPPORTED in codes or "PERSISTED_QUERY_NOT_SUPPORTED" in codes
+        # Сервер без APQ может просто не найти текст запроса и вернуть ошибку без data
+        if errors and not page.has_data and not is_auth_error(errors):
+            unsupported = True
+        if unsupported:
+            self.enabled = False
+            metrics.inc("graphql_apq_total", result="unsupported")
+            logger.warning("Запрос по хэшу отклонен (%s), persisted queries выключены, запросы идут с полным текстом.",
+                           status_code)
+            return True
+        metrics.inc("graphql_apq_total", result="hit")
+        return False
+
+persisted_queries = PersistedQueries()
+
+def build_lots_payload(offset=0, limit=LOTS_PAGE_SIZE, filter_overrides=None, hash_only=False):
+    """
+    Тело GraphQL-запроса BiddingsList для страницы [offset, offset + limit).
+    При включенных APQ добавляется хэш запроса; hash_only — без текста запроса.
+    """
+    payload = {
+        "operationName": "BiddingsList",
+        "variables": {
+            "filter": lots_filter_input(offset, limit, filter_overrides)
+        },
     }
+    if not hash_only:
+        payload["query"] = LOTS_QUERY
+    if persisted_queries.enabled:
+        payload["extensions"] = {"persistedQuery": {"version": 1, "sha256Hash": LOTS_QUERY_HASH}}
+    return payload
+
+def loads_json(content):
+    """json.loads через orjson, если он установлен."""
+    return orjson.loads(content) if orjson is not None else json.loads(content)
+
+def lots_page_from_json(json_response):
+    """LotsPage из уже разобранного ответа BiddingsList."""
+    data = json_response.get("data") or {}
+    return LotsPage(
+        lots=[Lot.from_dict(lot) for lot in data.get("Lots") or [] if lot],
+        errors=json_response.get("errors"),
+        has_data=bool(data),
+    )
+
+def stream_lots_page(raw):
+    """
+    Потоковый разбор тела BiddingsList из файлоподобного raw через ijson.
+    Каждый элемент data.Lots собирается в dict и сразу превращается в запись Lot,
+    поэтому полное дерево ответа в памяти не строится.
+    """
+    page = LotsPage()
+    builder = None
+    target = None
+    for prefix, event, value in ijson.parse(raw, use_float=True):
+        if builder is None:
+            if event == "start_map" and prefix in ("data.Lots.item", "errors.item"):
+                builder = ObjectBuilder()
+                target = prefix
+            else:
+                if event == "start_map" and prefix == "data":
+                    page.has_data = True
+                continue
+        builder.event(event, value)
+        if event == "end_map" and prefix == target:
+            if target == "data.Lots.item":
+                page.lots.append(Lot.from_dict(builder.value))
+            else:
+                page.errors.append(builder.value)
+            builder = None
+    return page
+
+def decode_lots_response(response, decoder=LOTS_DECODER):
+    """
+    Разбирает ответ BiddingsList в LotsPage. None, если тело не JSON.
+    Успешный ответ, полученный с stream=True, при decoder=stream читается потоково;
+    остальные тела читаются целиком, чтобы их текст остался доступен для лога.
+    С CAPTURE_DIR успешные ответы с data сохраняются в архив как есть.
+    """
+    capture = response_capture is not None and response.status_code == 200
+    if decoder == "stream" and ijson is not None and response.status_code == 200:
+        writer = response_capture.begin() if capture else None
+        response.raw.decode_content = True
+        page = None
+        try:
+            page = stream_lots_page(response.raw if writer is None else TeeReader(response.raw, writer))
+        except JSON_DECODE_ERRORS:
+            page = None
+        except (Urllib3HTTPError, OSError) as e:
+            # Обрыв при потоковом чтении обрабатываем как обычную ошибку соединения
+            raise requests.ConnectionError(e) from e
+        finally:
+            if writer is not None and (page is None or not page.has_data):
+                writer.discard()
+        if writer is not None and page is not None and page.has_data:
+            writer.commit()
+        return page
 
     try:
-        response = requests.post(GRAPHQL_URL, cookies=cookies, headers=headers, json=payload)
-        if response.status_code == 200:
-            json_response = response.json()
+        page = lots_page_from_json(response.json() if decoder == "json" else loads_json(response.content))
+    except JSON_DECODE_ERRORS:
+        return None
+    if capture and page.has_data:
+        response_capture.save(response.content)
+    return page
+
+@metrics.timed("ozon_graphql_request_seconds")
+def send_post_request(cookies, processed_ids, offset=0, limit=LOTS_PAGE_SIZE, lots_filter=None):
+    """Запрашивает страницу BiddingsList. Возвращает LotsPage или None при ошибке."""
+    headers = {
+        "Content-Type": "application/json",
+    }
+
+    hash_only = persisted_queries.enabled
+    # Тело успешного ответа читается потоково в decode_lots_response
+    stream = LOTS_DECODER == "stream"
+
+    try:
+        response = request_with_retries("POST", GRAPHQL_URL, cookies=cookies, headers=headers, stream=stream,
+                                        json=build_lots_payload(offset, limit, lots_filter, hash_only))
+        page = decode_lots_response(response) if response.status_code == 200 else None
+        if hash_only and persisted_queries.needs_full_query(response.status_code, page):
+            response.close()
+            response = request_with_retries("POST", GRAPHQL_URL, cookies=cookies, headers=headers, stream=stream,
+                                            json=build_lots_payload(offset, limit, lots_filter))
+            page = decode_lots_response(response) if response.status_code == 200 else None
+        with response:
+            if response.status_code in AUTH_STATUS_CODES:
+                raise AuthError(f"GraphQL API ответил {response.status_code}")
+            if response.status_code != 200:
+                logger.error("Ошибка запроса: %s - %s", response.status_code, response.text)
+                return None
+            if page is None:
+                logger.error("Некорректный JSON в ответе GraphQL API.")
+                return None
+            if is_auth_error(page.errors):
+                raise AuthError("GraphQL API отклонил куки")
             logger.info("Успешный запрос к GraphQL API.")
-            return json_response
-        else:
-            logger.error(f"Ошибка запроса: {response.status_code} - {response.text}")
-            return None
+            return page
     except requests.RequestException as e:
-        logger.error(f"Исключение при запросе к GraphQL API: {e}")
+        logger.error("Исключение при запросе к GraphQL API: %s", e)
         return None
+
+def is_auth_error(errors):
+    """Есть ли среди GraphQL errors отказ в авторизации."""
+    for error in errors or []:
+        code = str((error.get("extensions") or {}).get("code", "")).upper()
+        message = str(error.get("message", "")).lower()
+        if code in AUTH_ERROR_CODES or "unauthorized" in message or "forbidden" in message:
+            return True
+    return False
+
+def page_limits(max_pages=LOTS_MAX_PAGES, max_lots=LOTS_MAX_PER_POLL, page_size=LOTS_PAGE_SIZE):
+    """Смещения и размеры страниц в пределах бюджета опроса."""
+    offset = 0
+    for _ in range(max_pages):
+        limit = min(page_size, max_lots - offset)
+        if limit <= 0:
+            return
+        yield offset, limit
+        offset += limit
+
+def iter_lot_pages(cookies, max_pages=LOTS_MAX_PAGES, max_lots=LOTS_MAX_PER_POLL, page_size=LOTS_PAGE_SIZE,
+                   lots_filter=None):
+    """
+    Постранично выбирает лоты BiddingsList и отдает их списками записей Lot по мере поступления.
+    Следующая страница запрашивается в фоне, пока вызывающий код обрабатывает текущую.
+    Если не удалось получить даже первую страницу, не отдает ничего.
+    При отказе в авторизации пробрасывает AuthError. lots_filter — поля LotsInput воркера.
+    """
+    pages = list(page_limits(max_pages, max_lots, page_size))
+    if not pages:
+        return
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="lots-prefetch") as executor:
+        offset, limit = pages[0]
+        future = executor.submit(send_post_request, cookies, None, offset, limit, lots_filter)
+        for index, (offset, limit) in enumerate(pages):
+            page = future.result()
+            if page is None:
+                if index:
+                    logger.error("Не удалось получить страницу лотов со смещением %s. Выборка прервана.", offset)
+                return
+
+            lots = page.lots
+            is_last = len(lots) < limit or index + 1 == len(pages)
+            if not is_last:
+                next_offset, next_limit = pages[index + 1]
+                future = executor.submit(send_post_request, cookies, None, next_offset, next_limit, lots_filter)
+            yield lots
+            if is_last:
+                return
@@ -0,0 +1,266 @@
+# async_engine.py
+
+import asyncio
+import json
+import logging
+import time
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+from config import (
+    ATI_API_URL, GRAPHQL_URL, GEOCODE_CHUNK_SIZE, GEOCODE_OFFLINE, ASYNC_GEOCODE_CONCURRENCY,
+    HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_MAX_RETRIES, HTTP_BACKOFF_MAX, HTTP_POOL_SIZE,
+    LOTS_PAGE_SIZE, LOTS_DECODER, PRINT_NEW_REQUESTS,
+)
+from logger import logger, log_poll_summary
+from api_client import (
+    RETRY_STATUS_CODES, AUTH_STATUS_CODES, AuthError, is_auth_error, backoff_delay, retry_after_delay,
+    build_lots_payload, ati_headers, parse_city_ids_response, unknown_city_ids, page_limits,
+    persisted_queries, decode_lots_response,
+)
+from geocode_cache import geocode_cache
+import metrics
+from data_processing import collect_lot_changes
+from session_manager import SessionManager
+from storage import ProcessedIdStore, save_new_requests
+from polling import commit_page, finish_poll
+from scheduler import PollScheduler, new_poll_summary, merge_auction_timing
+from workers import load_workers, default_worker
+from publisher import get_publisher, publish_requests, close_publisher
+
+try:
+    import httpx
+    # httpx пишет INFO-строку на каждый запрос
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+except ImportError:  # асинхронный режим опционален
+    httpx = None
+
+def create_async_client():
+    """Общий httpx.AsyncClient с пулом keep-alive соединений и таймаутами из config."""
+    if httpx is None:
+        raise RuntimeError("Для асинхронного режима установите httpx: pip install httpx")
+    client = httpx.AsyncClient(
+        timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        limits=httpx.Limits(max_connections=HTTP_POOL_SIZE, max_keepalive_connections=HTTP_POOL_SIZE),
+    )
+    # Клиент общий для воркеров разных аккаунтов: Set-Cookie не накапливаем, куки передаются явно
+    client.cookies.jar.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    return client
+
+def client_host(url):
+    return urlsplit(url).netloc
+
+async def async_request_with_retries(client, method, url, max_retries=HTTP_MAX_RETRIES, **kwargs):
+    """Асинхронный аналог api_client.request_with_retries."""
+    for attempt in range(max_retries + 1):
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.TransportError as e:
+            metrics.inc("http_errors_total", host=client_host(url), error=type(e).__name__)
+            if attempt == max_retries:
+                raise
+            delay = backoff_delay(attempt)
+            logger.warning("Ошибка соединения с %s: %r. Повтор через %.1f с.", url, e, delay)
+        else:
+            metrics.inc("http_responses_total", host=client_host(url), status=response.status_code)
+            if response.status_code not in RETRY_STATUS_CODES or attempt == max_retries:
+                return response
+            delay = retry_after_delay(response)
+            if delay is None:
+                delay = backoff_delay(attempt)
+            elif delay > HTTP_BACKOFF_MAX:
+                logger.warning("%s просит повторить через %.0f с. Повтор отменен.", url, delay)
+                return response
+            logger.warning("Ответ %s от %s. Повтор через %.1f с.", response.status_code, url, delay)
+        await asyncio.sleep(delay)
+
+# httpx отдает тело целиком, потоковый ijson здесь заменяется разбором через orjson
+ASYNC_LOTS_DECODER = "orjson" if LOTS_DECODER == "stream" else LOTS_DECODER
+
+@metrics.timed("ozon_graphql_request_seconds")
+async def async_send_post_request(client, cookies, offset=0, limit=LOTS_PAGE_SIZE, lots_filter=None):
+    """Асинхронный аналог api_client.send_post_request: LotsPage или None при ошибке."""
+    headers = {
+        "Content-Type": "application/json",
+    }
+
+    hash_only = persisted_queries.enabled
+
+    try:
+        response = await async_request_with_retries(
+            client, "POST", GRAPHQL_URL, cookies=cookies, headers=headers,
+            json=build_lots_payload(offset, limit, lots_filter, hash_only),
+        )
+        page = decode_lots_response(response, ASYNC_LOTS_DECODER) if response.status_code == 200 else None
+        if hash_only and persisted_queries.needs_full_query(response.status_code, page):
+            response = await async_request_with_retries(
+                client, "POST", GRAPHQL_URL, cookies=cookies, headers=headers,
+                json=build_lots_payload(offset, limit, lots_filter),
+            )
+            page = decode_lots_response(response, ASYNC_LOTS_DECODER) if response.status_code == 200 else None
+        if response.status_code in AUTH_STATUS_CODES:
+            raise AuthError(f"GraphQL API ответил {response.status_code}")
+        if response.status_code != 200:
+            logger.error("Ошибка запроса: %s - %s", response.status_code, response.text)
+            return None
+        if page is None:
+            logger.error("Некорректный JSON в ответе GraphQL API.")
+            return None
+        if is_auth_error(page.errors):
+            raise AuthError("GraphQL API отклонил куки")
+        logger.info("Успешный запрос к GraphQL API.")
+        return page
+    except httpx.HTTPError as e:
+        logger.error("Исключение при запросе к GraphQL API: %r", e)
+        return None
+
+async def _async_fetch_city_ids(client, unique_addresses, semaphore):
+    async with semaphore:
+        logger.info("Запрос к API с %s уникальными адресами.", len(unique_addresses))
+        try:
+            response = await async_request_with_retries(
+                client, "POST", ATI_API_URL, headers=ati_headers(), json=unique_addresses
+            )
+        except httpx.HTTPError as e:
+            logger.error("Исключение при запросе к ATI API: %r", e)
+            return unknown_city_ids(unique_addresses)
+
+    if response.status_code == 200:
+        logger.info("Успешный ответ от ATI API.")
+        return parse_city_ids_response(response.json(), unique_addresses)
+    logger.error("Ошибка при запросе к ATI API: %s - %s", response.status_code, response.text)
+    return unknown_city_ids(unique_addresses)
+
+@metrics.timed("ati_geocode_seconds")
+async def async_get_city_ids(client, addresses, semaphore, chunk_size=GEOCODE_CHUNK_SIZE):
+    """Асинхронный get_city_ids: промахи кэша разбиваются на пачки, которые идут в ATI параллельно."""
+    unique_addresses = list(dict.fromkeys(addresses))
+    city_info_mapping, missing_addresses = geocode_cache.get_many(unique_addresses)
+    if not missing_addresses:
+        logger.info("Все %s адресов найдены в кэше геокодинга.", len(unique_addresses))
+        return city_info_mapping
+    if GEOCODE_OFFLINE:
+        logger.info("Нет в кэше геокодинга: %s адресов (ATI не запрашивается).", len(missing_addresses))
+        city_info_mapping.update(unknown_city_ids(missing_addresses))
+        return city_info_mapping
+
+    chunks = [missing_addresses[start:start + chunk_size] for start in range(0, len(missing_addresses), chunk_size)]
+    for chunk_mapping in await asyncio.gather(*(_async_fetch_city_ids(client, chunk, semaphore) for chunk in chunks)):
+        city_info_mapping.update(chunk_mapping)
+    return city_info_mapping
+
+async def async_iter_lot_pages(client, cookies, lots_filter=None):
+    """Асинхронный аналог api_client.iter_lot_pages с предзагрузкой следующей страницы."""
+    pages = list(page_limits())
+    if not pages:
+        return
+
+    task = asyncio.create_task(async_send_post_request(client, cookies, *pages[0], lots_filter))
+    try:
+        for index, (offset, limit) in enumerate(pages):
+            page = await task
+            if page is None:
+                if index:
+                    logger.error("Не удалось получить страницу лотов со смещением %s. Выборка прервана.", offset)
+                return
+
+            lots = page.lots
+            is_last = len(lots) < limit or index + 1 == len(pages)
+            if not is_last:
+                task = asyncio.create_task(async_send_post_request(client, cookies, *pages[index + 1], lots_filter))
+            yield lots
+            if is_last:
+                return
+    finally:
+        if not task.done():
+            task.cancel()
+
+async def async_process_requests(client, cookies, processed_ids, semaphore, worker=None):
+    """
+    Получает лоты воркера, собирает тела новых заявок и дописывает их в request_sink.
+    Возвращает (заявки, итоги опроса). Сброс на диск выполняет вызывающий код.
+    """
+    worker = worker or default_worker()
+    summary = new_poll_summary()
+    summary["worker"] = worker["name"]
+    started = time.perf_counter()
+    new_requests = []
+
+    try:
+        async for lots in async_iter_lot_pages(client, cookies, worker["filter"]):
+            summary["pages"] += 1
+            summary["seen"] += len(lots)
+            merge_auction_timing(summary, lots)
+            new_lots, changed_lots, addresses = collect_lot_changes(lots, processed_ids)
+            city_info_mapping = await async_get_city_ids(client, addresses, semaphore) if addresses else {}
+
+            # Между отбором лотов и записью был await: лот мог успеть записать другой воркер
+            new_requests.extend(commit_page(new_lots, changed_lots, city_info_mapping, processed_ids, summary))
+    except AuthError as e:
+        logger.error("Сервер отклонил куки: %s", e)
+        summary["auth_failed"] = True
+
+    if not finish_poll(summary, worker, started):
+        return new_requests, summary
+    log_poll_summary(summary)
+    return new_requests, summary
+
+def _persist(new_requests, processed_ids):
+    save_new_requests(new_requests, processed_ids)
+    publish_requests(new_requests)
+    if new_requests and PRINT_NEW_REQUESTS:
+        print(json.dumps(new_requests, ensure_ascii=False, indent=4))
+
+async def poll_loop(client, session, processed_ids, semaphore, scheduler=None, worker=None):
+    """
+    Цикл опроса воркера с куки из session (SessionManager). Сброс результатов на диск идет
+    в отдельном потоке и перекрывается со следующим опросом. Циклы воркеров идут через asyncio.gather.
+    """
+    worker = worker or default_worker()
+    scheduler = scheduler or PollScheduler()
+    persist_task = None
+    while True:
+        scheduler.start_poll()
+        logger.info("Запуск обработки заявок (%s).", worker["name"])
+        # Обновление куки через браузер блокирующее, поэтому в отдельном потоке
+        cookies = await asyncio.to_thread(session.get_cookies)
+        new_requests, summary = await async_process_requests(client, cookies, processed_ids, semaphore, worker)
+
+        if persist_task is not None:
+            await persist_task
+        persist_task = asyncio.create_task(asyncio.to_thread(_persist, new_requests, processed_ids))
+
+        if summary["auth_failed"] and session.invalidate():
+            logger.info("Повтор опроса с обновленными куки.")
+            continue
+
+        delay = scheduler.next_delay(summary)
+        metrics.log_summary_if_due()
+        logger.info("Завершена обработка заявок (%s). Следующий опрос через %.0f секунд.", worker["name"], delay)
+        await asyncio.sleep(delay)
+
+async def _main_async():
+    metrics.start_metrics_server()
+    processed_ids = await asyncio.to_thread(ProcessedIdStore)
+    workers = await asyncio.to_thread(load_workers)
+    await asyncio.to_thread(get_publisher)
+    # Семафор геокодинга, пул соединений и хранилище ID общие для всех воркеров
+    semaphore = asyncio.Semaphore(ASYNC_GEOCODE_CONCURRENCY)
+    sessions = [SessionManager(cookies_file=worker["cookies_file"]) for worker in workers]
+    try:
+        async with create_async_client() as client:
+            await asyncio.gather(*(
+                poll_loop(client, session, processed_ids, semaphore, worker=worker)
+                for worker, session in zip(workers, sessions)
+            ))
+    finally:
+        for session in sessions:
+            await asyncio.to_thread(session.close)
+        await asyncio.to_thread(close_publisher)
+
+def run_async():
+    try:
+        asyncio.run(_main_async())
+    except KeyboardInterrupt:
+        logger.info("Программа остановлена пользователем.")
+    except Exception as e:
+        logger.error("Неожиданная ошибка: %s", e)
@@ -0,0 +1,153 @@
+# backfill.py
+#
+# Пересборка тел заявок из архива ответов BiddingsList (*.json, *.json.gz), например
+# после правки шаблона в create_request_body. Запуск из корня проекта:
+#   python backfill.py captures/ --output backfill_requests.jsonl --workers 8
+
+import argparse
+import gzip
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from config import BACKFILL_WORKERS, BACKFILL_FILES_PER_TASK, BACKFILL_OUTPUT_FILE
+from logger import logger
+import api_client
+from api_client import get_city_ids, loads_json, lots_page_from_json
+from data_processing import apply_cached_lane, build_lot_request, dumps_request_body
+from geocode_cache import GeocodeCache
+from storage import JsonlSink
+from transport_types import transport_types
+
+ARCHIVE_SUFFIXES = (".json", ".json.gz")
+
+
+def iter_archive_files(paths):
+    """Файлы архива из путей (файлы и каталоги) в порядке имен; в именах снимков — время получения."""
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        found = []
+        for root, _, names in os.walk(path):
+            found.extend(os.path.join(root, name) for name in names if name.endswith(ARCHIVE_SUFFIXES))
+        yield from sorted(found)
+
+
+def read_archive(path):
+    """LotsPage из сохраненного ответа BiddingsList."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        return lots_page_from_json(loads_json(f.read()))
+
+
+def iter_file_chunks(paths, files_per_task=BACKFILL_FILES_PER_TASK):
+    """Файлы архива пачками по files_per_task в порядке имен."""
+    chunk = []
+    for path in iter_archive_files(paths):
+        chunk.append(path)
+        if len(chunk) >= files_per_task:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def init_worker():
+    """
+    Инициализация процесса пула: новые типы транспорта сохраняет только основной процесс,
+    кэш геокодинга открывается заново — SQLite-соединение родителя после fork использовать нельзя.
+    """
+    transport_types.persist = False
+    api_client.geocode_cache = GeocodeCache()
+
+
+def build_files(paths):
+    """
+    Задача пула: чтение и разбор снимков, геокодинг (кэш направлений, SQLite-кэш, промахи — в ATI),
+    сборка и сериализация тел. Каждая версия лота (ID, Version) собирается один раз на задачу.
+    Возвращает ([((ID, Version), строка JSONL)], [(TransportType.ID, Name, Capacity)]).
+    """
+    seen = set()
+    lots = []
+    for path in paths:
+        try:
+            page = read_archive(path)
+        except (OSError, ValueError) as e:
+            logger.error("Не удалось прочитать архив %s: %s", path, e)
+            continue
+        for lot in page.lots:
+            key = (lot.id, lot.version)
+            if key not in seen:
+                seen.add(key)
+                lots.append(lot)
+
+    addresses = [wp.address for lot in lots if not apply_cached_lane(lot) for wp in lot.way_points]
+    city_info_mapping = get_city_ids(addresses) if addresses else {}
+    lines = [((lot.id, lot.version), dumps_request_body(build_lot_request(lot, city_info_mapping)))
+             for lot in lots]
+    types = {(lot.transport_type_id, lot.transport_name, lot.transport_capacity)
+             for lot in lots if lot.transport_type_id is not None}
+    return lines, list(types)
+
+
+def run_backfill(paths, output=BACKFILL_OUTPUT_FILE, workers=BACKFILL_WORKERS,
+                 files_per_task=BACKFILL_FILES_PER_TASK):
+    """
+    Собирает тела заявок для всех версий лотов из архива и пишет их в output.
+    Чтение, разбор, геокодинг и сборка идут в пуле процессов пачками файлов; основной процесс
+    только раздает пути и пишет результаты в порядке пачек, пропуская версии лотов, уже
+    записанные по более раннему снимку. В пуле одновременно не больше двух пачек на процесс.
+    processed_ids и основной поток заявок не затрагиваются.
+    Возвращает число записанных заявок.
+    """
+    workers = workers or os.cpu_count() or 1
+    # Результат каждого запуска — полный набор заявок, старый файл перезаписывается
+    open(output, "wb").close()
+    sink = JsonlSink(output, max_bytes=0, max_age=0, compression=None)
+    written = 0
+    seen = set()
+    started = time.perf_counter()
+    in_flight = deque()
+
+    def write_next():
+        nonlocal written
+        lines, types = in_flight.popleft().result()
+        for key, line in lines:
+            if key in seen:
+                continue
+            seen.add(key)
+            sink.write_line(line)
+            written += 1
+        # Новые типы транспорта попадают в справочник основного процесса и сохраняются в файл
+        for type_id, name, capacity in types:
+            transport_types.lookup(type_id, name, capacity)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+        for chunk in iter_file_chunks(paths, files_per_task):
+            in_flight.append(executor.submit(build_files, chunk))
+            if len(in_flight) >= workers * 2:
+                write_next()
+        while in_flight:
+            write_next()
+    sink.close()
+
+    elapsed = time.perf_counter() - started
+    logger.info("Пересобрано заявок: %s за %.1f с (%.0f/с, процессов: %s) -> %s",
+                written, elapsed, written / elapsed if elapsed else 0, workers, output)
+    return written
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Пересборка тел заявок из архива ответов BiddingsList")
+    parser.add_argument("paths", nargs="+", help="файлы *.json / *.json.gz или каталоги с ними")
+    parser.add_argument("--output", default=BACKFILL_OUTPUT_FILE, help="файл JSONL с результатом")
+    parser.add_argument("--workers", type=int, default=BACKFILL_WORKERS, help="процессов (0 — по числу ядер)")
+    parser.add_argument("--files-per-task", type=int, default=BACKFILL_FILES_PER_TASK,
+                        help="файлов архива в одной задаче пула")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    run_backfill(args.paths, args.output, args.workers, args.files_per_task)
@@ -0,0 +1,117 @@
+# benchmarks/bench_pipeline.py
+#
+# Сквозной офлайн-замер main.process_requests на локальных заглушках Ozon и ATI.
+# Отчет: лотов/с, p50/p99 задержки на лот (от начала опроса до записи заявки),
+# HTTP-вызовов на лот и пиковый RSS.
+# Запуск из корня проекта: python benchmarks/bench_pipeline.py --polls 20 --board-size 120
+
+import argparse
+import contextlib
+import io
+import logging
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from stub_servers import StubBackend, StubSettings, start_stub_server
+
+try:
+    import resource
+except ImportError:  # нет на Windows
+    resource = None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Офлайн-замер пропускной способности конвейера")
+    parser.add_argument("--polls", type=int, default=20, help="число опросов")
+    parser.add_argument("--board-size", type=int, default=40, help="лотов в InBidding на заглушке")
+    parser.add_argument("--new-per-poll", type=int, default=10, help="новых лотов между опросами")
+    parser.add_argument("--page-size", type=int, default=40, help="LOTS_PAGE_SIZE")
+    parser.add_argument("--graphql-latency", type=float, default=0.05, help="задержка GraphQL, с")
+    parser.add_argument("--ati-latency", type=float, default=0.05, help="задержка ATI, с")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 503")
+    return parser.parse_args()
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдает килобайты, macOS — байты
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def main():
+    args = parse_args()
+    backend = StubBackend(StubSettings(args.graphql_latency, args.ati_latency, args.error_rate, args.board_size))
+    server, graphql_url, ati_url = start_stub_server(backend)
+
+    # Настройки должны попасть в окружение до импорта config
+    os.environ.update({
+        "GRAPHQL_URL": graphql_url,
+        "ATI_API_URL": ati_url,
+        "LOTS_PAGE_SIZE": str(args.page_size),
+        "LOTS_MAX_PER_POLL": str(max(args.board_size, args.page_size)),
+        "LOTS_MAX_PAGES": str(args.board_size // args.page_size + 1),
+        "HTTP_BACKOFF_BASE": "0.01",
+    })
+    # Файлы состояния (кэш, журналы, заявки) создаются во временном каталоге
+    workdir = tempfile.mkdtemp(prefix="ozon_tms_bench_")
+    os.chdir(workdir)
+
+    import main as pipeline
+    from logger import logger
+    from storage import ProcessedIdStore, request_sink
+
+    logger.setLevel(logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    processed_ids = ProcessedIdStore()
+    latencies = []
+    poll_started = [0.0]
+    original_write = request_sink.write
+
+    def timed_write(request_body):
+        original_write(request_body)
+        latencies.append(time.perf_counter() - poll_started[0])
+
+    request_sink.write = timed_write
+
+    started = time.perf_counter()
+    for _ in range(args.polls):
+        poll_started[0] = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            pipeline.process_requests({}, None, processed_ids)
+        backend.advance(args.new_per_poll)
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+
+    lots = len(latencies)
+    http_calls = backend.calls["graphql"] + backend.calls["ati"]
+    rss = peak_rss_mb()
+    print(f"Каталог состояния:     {workdir}")
+    print(f"Опросов:               {args.polls}")
+    print(f"Обработано лотов:      {lots}")
+    print(f"Лотов/с:               {lots / elapsed:.1f}")
+    print(f"Задержка на лот p50:   {percentile(latencies, 0.50) * 1000:.1f} мс")
+    print(f"Задержка на лот p99:   {percentile(latencies, 0.99) * 1000:.1f} мс")
+    print(f"HTTP-вызовов:          {http_calls} (GraphQL {backend.calls['graphql']}, ATI {backend.calls['ati']}, "
+          f"ошибок {backend.calls['errors']})")
+    print(f"HTTP-вызовов на лот:   {http_calls / lots if lots else 0:.2f}")
+    print(f"Пиковый RSS:           {rss:.1f} МБ" if rss is not None else "Пиковый RSS:           н/д")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# benchmarks/bench_request_body.py
+#
+# Микробенчмарк сборки тела заявки: create_route + create_request_body против шаблона
+# fill_request_body, и сериализация json против dumps_request_body (orjson, если установлен).
+# Запуск из корня проекта: python benchmarks/bench_request_body.py [число_повторов]
+
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_processing import create_route, create_request_body, fill_request_body, dumps_request_body, orjson
+from models import WayPoint
+
+def sample_way_points(count=4):
+    return [
+        WayPoint(
+            arrival_at=f"2024-10-{10 + i:02d}T{8 + i:02d}:30:00Z",
+            address=f"Московская обл., г. Подольск, ул. Складская, д. {i + 1}",
+            date=f"2024-10-{10 + i:02d}",
+            time=f"{8 + i:02d}:30:00",
+            city_id=1000 + i,
+        )
+        for i in range(count)
+    ]
+
+def legacy_build(lot_id, way_points):
+    route = create_route(way_points, "20", "82")
+    return create_request_body(lot_id, 45000, 500, route, way_points[1:-1])
+
+def template_build(lot_id, way_points):
+    return fill_request_body(lot_id, 45000, 500, way_points, "20", "82")
+
+def report(name, seconds, number):
+    print(f"{name:<40} {seconds / number * 1e6:8.2f} мкс/заявка")
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    way_points = sample_way_points()
+
+    # Оба пути должны давать одинаковый JSON
+    assert json.dumps(legacy_build(1, way_points)) == json.dumps(template_build(1, way_points))
+
+    legacy = timeit.timeit(lambda: legacy_build(1, way_points), number=number)
+    template = timeit.timeit(lambda: template_build(1, way_points), number=number)
+    report("create_route + create_request_body", legacy, number)
+    report("fill_request_body", template, number)
+    print(f"Ускорение сборки: {legacy / template:.2f}x")
+
+    body = template_build(1, way_points)
+    stdlib = timeit.timeit(lambda: json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), number=number)
+    fast = timeit.timeit(lambda: dumps_request_body(body), number=number)
+    report("json.dumps + encode", stdlib, number)
+    report(f"dumps_request_body ({'orjson' if orjson else 'json'})", fast, number)
+    print(f"Ускорение сериализации: {stdlib / fast:.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# benchmarks/stub_servers.py
+#
+# Локальные заглушки Ozon GraphQL (BiddingsList) и ATI locations/parse для офлайн-замеров.
+# Ответы собираются из записанных фикстур в benchmarks/fixtures.
+
+import copy
+import json
+import os
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class StubSettings:
+    """Параметры поведения заглушек. Меняются на лету из кода замера."""
+
+    def __init__(self, graphql_latency=0.05, ati_latency=0.05, error_rate=0.0, board_size=40):
+        self.graphql_latency = graphql_latency
+        self.ati_latency = ati_latency
+        self.error_rate = error_rate
+        self.board_size = board_size  # сколько лотов сейчас в InBidding
+
+
+class StubBackend:
+    """
+    Состояние заглушек: «доска» лотов и счетчики вызовов.
+    Лоты доски — копии лотов из фикстуры с последовательными ID; advance(n) сдвигает
+    доску, и в следующем опросе появляются n новых лотов.
+    """
+
+    def __init__(self, settings=None):
+        self.settings = settings or StubSettings()
+        self.lot_templates = load_fixture("biddings_list.json")["data"]["Lots"]
+        self.ati_answers = load_fixture("ati_parse.json")
+        self.first_id = self.lot_templates[0]["ID"]
+        self.board_start = 0
+        self.calls = {"graphql": 0, "ati": 0, "errors": 0}
+        self._lock = threading.Lock()
+
+    def advance(self, new_lots):
+        with self._lock:
+            self.board_start += new_lots
+
+    def lot(self, index):
+        lot = copy.deepcopy(self.lot_templates[index % len(self.lot_templates)])
+        lot["ID"] = self.first_id + index
+        return lot
+
+    def lots_page(self, offset, limit):
+        with self._lock:
+            start = self.board_start
+        end = min(offset + limit, self.settings.board_size)
+        # Свежие лоты наверху, как в интерфейсе Ozon
+        indexes = range(start + self.settings.board_size - 1 - offset,
+                        start + self.settings.board_size - 1 - end, -1)
+        return {"data": {"Lots": [self.lot(i) for i in indexes]}}
+
+    def parse_addresses(self, addresses):
+        result = {}
+        for address in addresses:
+            answer = self.ati_answers.get(address)
+            if answer is None:
+                answer = {"is_success": True, "city_id": 3000 + sum(map(ord, address)) % 1000, "street": None}
+            result[address] = answer
+        return result
+
+    def count(self, key):
+        with self._lock:
+            self.calls[key] += 1
+
+    def reset_calls(self):
+        with self._lock:
+            self.calls = {key: 0 for key in self.calls}
+
+
+def _make_handler(backend):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"null")
+            settings = backend.settings
+            if self.path.startswith("/ati"):
+                backend.count("ati")
+                time.sleep(settings.ati_latency)
+                if random.random() < settings.error_rate:
+                    return self._error()
+                return self._json(backend.parse_addresses(body))
+
+            backend.count("graphql")
+            time.sleep(settings.graphql_latency)
+            if random.random() < settings.error_rate:
+                return self._error()
+            lots_filter = body.get("variables", {}).get("filter", {})
+            return self._json(backend.lots_page(lots_filter.get("Offset", 0), lots_filter.get("Limit", 40)))
+
+        def _json(self, payload, status=200):
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _error(self):
+            backend.count("errors")
+            self._json({"error": "stub"}, status=503)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_stub_server(backend, host="127.0.0.1", port=0):
+    """
+    Запускает заглушку в фоновом потоке. Возвращает (server, graphql_url, ati_url).
+    Обе заглушки живут на одном порту: /gql и /ati.
+    """
+    server = ThreadingHTTPServer((host, port), _make_handler(backend))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="stub-server", daemon=True).start()
+    base_url = f"http://{host}:{server.server_port}"
+    return server, base_url + "/gql", base_url + "/ati"
@@ -0,0 +1,113 @@
+# capture.py
+
+import gzip
+import itertools
+import os
+import threading
+from datetime import datetime, timezone
+from config import CAPTURE_DIR
+from logger import logger
+
+# Метка времени в имени снимка: по ней архив сортируется и воспроизводится с исходными паузами
+STAMP_FORMAT = "%Y%m%dT%H%M%S.%fZ"
+
+
+def capture_time(path):
+    """Время получения ответа из имени снимка (datetime UTC) или None."""
+    stamp = os.path.basename(path).split("-", 1)[0]
+    try:
+        return datetime.strptime(stamp, STAMP_FORMAT).replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+
+class CaptureWriter:
+    """Один снимок ответа: тело пишется сжатым во временный файл и появляется только после commit()."""
+
+    def __init__(self, path):
+        self.path = path
+        self._tmp_path = path + ".tmp"
+        self._file = gzip.open(self._tmp_path, "wb", compresslevel=5)
+        self.failed = False
+
+    def write(self, data):
+        # Ошибка записи снимка не должна прерывать разбор самого ответа
+        if self.failed:
+            return
+        try:
+            self._file.write(data)
+        except OSError as e:
+            logger.warning("Не удалось записать снимок ответа %s: %s", self.path, e)
+            self.failed = True
+
+    def commit(self):
+        if self.failed:
+            self.discard()
+            return
+        try:
+            self._file.close()
+            os.replace(self._tmp_path, self.path)
+        except OSError as e:
+            logger.warning("Не удалось сохранить снимок ответа %s: %s", self.path, e)
+
+    def discard(self):
+        try:
+            self._file.close()
+            os.remove(self._tmp_path)
+        except OSError:
+            pass
+
+
+class TeeReader:
+    """Файлоподобная обертка над потоком ответа: все прочитанное дублируется в CaptureWriter."""
+
+    def __init__(self, raw, writer):
+        self._raw = raw
+        self._writer = writer
+
+    def read(self, size=-1):
+        data = self._raw.read(size)
+        if data:
+            self._writer.write(data)
+        return data
+
+
+class ResponseCapture:
+    """
+    Архив сырых ответов GraphQL: по файлу *.json.gz на ответ в подкаталоге дня,
+    имя начинается с UTC-метки получения. Архив читают backfill.py и replay.py.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def begin(self):
+        """
+        Новый снимок; вызывающий код пишет тело и делает commit() или discard().
+        None, если файл снимка создать не удалось.
+        """
+        now = datetime.now(timezone.utc)
+        day_dir = os.path.join(self.directory, now.strftime("%Y%m%d"))
+        with self._lock:
+            seq = next(self._seq)
+        name = f"{now.strftime(STAMP_FORMAT)}-{os.getpid()}-{seq:06d}.json.gz"
+        try:
+            os.makedirs(day_dir, exist_ok=True)
+            return CaptureWriter(os.path.join(day_dir, name))
+        except OSError as e:
+            logger.warning("Не удалось создать снимок ответа в %s: %s", day_dir, e)
+            return None
+
+    def save(self, content):
+        """Сохраняет тело, уже прочитанное целиком."""
+        writer = self.begin()
+        if writer is not None:
+            writer.write(content)
+            writer.commit()
+
+
+response_capture = ResponseCapture(CAPTURE_DIR) if CAPTURE_DIR else None
+if response_capture is not None:
+    logger.info("Ответы GraphQL сохраняются в %s.", CAPTURE_DIR)
@@ -8,15 +8,141 @@ load_dotenv()  # Загрузить переменные из .env файла
 
 CHROMEDRIVER_PATH = 'path/to/chromedriver'
 AUTH_URL = "https://tms.ozon.ru/ozi-orders"
-ATI_API_URL = "https://api.ati.su/v1.0/dictionaries/locations/parse"
-GRAPHQL_URL = "https://tms.ozon.ru/graphql-decorator.lpp/gql"
+# URL можно переопределить через окружение, например для локальных заглушек из benchmarks/
+ATI_API_URL = os.getenv("ATI_API_URL", "https://api.ati.su/v1.0/dictionaries/locations/parse")
+GRAPHQL_URL = os.getenv("GRAPHQL_URL", "https://tms.ozon.ru/graphql-decorator.lpp/gql")
+ATI_CARGOS_URL = os.getenv("ATI_CARGOS_URL", "https://api.ati.su/v2/cargos")
 
 COOKIES_FILE = "cookies.json"
-PROCESSED_IDS_FILE = "processed_ids.json"
-ALL_REQUESTS_FILE = "all_requests.json"
+PROCESSED_IDS_FILE = "processed_ids.json"  # старый формат, читается для миграции
+PROCESSED_IDS_LOG = "processed_ids.log"
+REQUESTS_SINK_FILE = os.getenv("REQUESTS_SINK_FILE", "all_requests.jsonl")
+GEOCODE_CACHE_FILE = os.getenv("GEOCODE_CACHE_FILE", "geocode_cache.sqlite")
+PUBLISHED_IDS_LOG = os.getenv("PUBLISHED_IDS_LOG", "published_ids.log")
+PUBLISH_QUEUE_FILE = os.getenv("PUBLISH_QUEUE_FILE", "publish_queue.sqlite")
 
 AUTHORIZATION_TOKEN = os.getenv("AUTHORIZATION_TOKEN")
 BOARD_ID = os.getenv('BOARD_ID', 'Не указано')
 
-LOG_LEVEL = logging.INFO
+# Журнал обработанных ID сжимается, когда строк в нем больше, чем ID, в столько раз
+PROCESSED_IDS_COMPACT_RATIO = float(os.getenv("PROCESSED_IDS_COMPACT_RATIO", 2))
+# Срок хранения обработанных ID и период проверки устаревших (секунды)
+PROCESSED_IDS_RETENTION = int(os.getenv("PROCESSED_IDS_RETENTION", 14 * 24 * 3600))
+PROCESSED_IDS_EXPIRE_INTERVAL = int(os.getenv("PROCESSED_IDS_EXPIRE_INTERVAL", 3600))
+
+# Ротация потока заявок: размер (байты), возраст сегмента (секунды), сжатие: gzip, zstd или пусто
+REQUESTS_SINK_MAX_BYTES = int(os.getenv("REQUESTS_SINK_MAX_BYTES", 64 * 1024 * 1024))
+REQUESTS_SINK_MAX_AGE = int(os.getenv("REQUESTS_SINK_MAX_AGE", 24 * 3600))
+REQUESTS_SINK_COMPRESSION = os.getenv("REQUESTS_SINK_COMPRESSION", "gzip")
+
+# Кэш геокодинга адресов (секунды / количество записей)
+GEOCODE_CACHE_TTL = int(os.getenv("GEOCODE_CACHE_TTL", 30 * 24 * 3600))
+GEOCODE_CACHE_NEGATIVE_TTL = int(os.getenv("GEOCODE_CACHE_NEGATIVE_TTL", 3600))
+GEOCODE_CACHE_MAX_ENTRIES = int(os.getenv("GEOCODE_CACHE_MAX_ENTRIES", 50000))
+# Максимальное число адресов в одном запросе к ATI parse
+GEOCODE_CHUNK_SIZE = int(os.getenv("GEOCODE_CHUNK_SIZE", 100))
+# Кэш направлений (упорядоченные Point.ID маршрута -> city_id и блоки location): число направлений, 0 — выключен
+LANE_CACHE_SIZE = int(os.getenv("LANE_CACHE_SIZE", 5000))
+# Справочник типов транспорта Ozon -> вес, объем и название груза ATI (правится вручную)
+TRANSPORT_TYPES_FILE = os.getenv("TRANSPORT_TYPES_FILE", "transport_types.json")
+# Название груза ATI для типов без своего cargo_name
+DEFAULT_CARGO_NAME = os.getenv("DEFAULT_CARGO_NAME", "Любой закрытый")
+# GEOCODE_OFFLINE=1 — только кэш: промахи не уходят в ATI и получают city_id "Не указано" (для replay)
+GEOCODE_OFFLINE = os.getenv("GEOCODE_OFFLINE", "0") == "1"
+
+# HTTP-клиент: таймауты и повторы (секунды)
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 30))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", 3))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", 0.5))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", 30))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 10))
+
+# Набор полей BiddingsList: lean — только используемые, full — как в интерфейсе Ozon.
+# GRAPHQL_APQ=1 — отправлять запрос хэшем (Automatic Persisted Queries) с откатом на полный текст.
+# Выключено, пока поддержка APQ на стороне Ozon не подтверждена
+GRAPHQL_QUERY_VARIANT = os.getenv("GRAPHQL_QUERY_VARIANT", "lean")
+GRAPHQL_APQ = os.getenv("GRAPHQL_APQ", "0") == "1"
+
+# Разбор ответа BiddingsList: orjson — целиком через orjson (без него — как json), json — стандартный
+# response.json(), stream — потоково через ijson по мере чтения тела (без ijson — как orjson).
+# stream в несколько раз медленнее orjson на странице из 200 лотов, памяти не экономит и включается явно
+LOTS_DECODER = os.getenv("LOTS_DECODER", "orjson")
+
+# Каталог архива сырых ответов BiddingsList (*.json.gz с меткой времени); пусто — не сохранять
+CAPTURE_DIR = os.getenv("CAPTURE_DIR", "")
+
+# Постраничная выборка лотов: размер страницы и бюджет на один опрос
+LOTS_PAGE_SIZE = int(os.getenv("LOTS_PAGE_SIZE", 40))
+LOTS_MAX_PAGES = int(os.getenv("LOTS_MAX_PAGES", 10))
+LOTS_MAX_PER_POLL = int(os.getenv("LOTS_MAX_PER_POLL", 400))
+
+# Цикл опроса: начальный интервал и границы адаптивного планировщика (секунды)
+POLL_INTERVAL = float(os.getenv("POLL_INTERVAL", 60))
+POLL_MIN_INTERVAL = float(os.getenv("POLL_MIN_INTERVAL", 15))
+POLL_MAX_INTERVAL = float(os.getenv("POLL_MAX_INTERVAL", 300))
+POLL_ERROR_BACKOFF_MAX = float(os.getenv("POLL_ERROR_BACKOFF_MAX", 600))
+# Сколько новых лотов в среднем должно приходиться на один опрос
+POLL_TARGET_NEW_LOTS = float(os.getenv("POLL_TARGET_NEW_LOTS", 5))
+# Доля самого короткого BiddingDurationSeconds, которую не должен превышать интервал
+POLL_SHORT_AUCTION_FRACTION = float(os.getenv("POLL_SHORT_AUCTION_FRACTION", 0.5))
+# Инкрементальный режим: лоты с новой Version повторно собираются и пишутся как события обновления
+INCREMENTAL_MODE = os.getenv("INCREMENTAL_MODE", "0") == "1"
+# Асинхронный режим (нужен httpx): ASYNC_MODE=1
+ASYNC_MODE = os.getenv("ASYNC_MODE", "0") == "1"
+ASYNC_GEOCODE_CONCURRENCY = int(os.getenv("ASYNC_GEOCODE_CONCURRENCY", 4))
+
+# Метрики: METRICS_ENABLED=1 включает сбор, METRICS_PORT — локальный /metrics (0 — без HTTP)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0") == "1"
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9108))
+METRICS_SUMMARY_INTERVAL = float(os.getenv("METRICS_SUMMARY_INTERVAL", 300))
+
+LOG_LEVEL = getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO)
 LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+# LOG_JSON=1 — структурированные JSON-строки вместо LOG_FORMAT; LOG_FILE — дополнительно писать в файл
+LOG_JSON = os.getenv("LOG_JSON", "0") == "1"
+LOG_FILE = os.getenv("LOG_FILE", "")
+# Запись логов через QueueHandler/QueueListener в отдельном потоке
+LOG_QUEUE = os.getenv("LOG_QUEUE", "1") == "1"
+# Печатать тела новых заявок в stdout (они и так пишутся в REQUESTS_SINK_FILE)
+PRINT_NEW_REQUESTS = os.getenv("PRINT_NEW_REQUESTS", "0") == "1"
+
+# Жизненный цикл куки: обновлять за SESSION_REFRESH_MARGIN до истечения куки авторизации, но не чаще
+# SESSION_MIN_REFRESH_INTERVAL; неудачные упреждающие обновления откладываются с ростом паузы
+# до SESSION_REFRESH_BACKOFF_MAX (секунды). BROWSER_LOGIN_TIMEOUT — ожидание входа в Chrome
+SESSION_REFRESH_MARGIN = float(os.getenv("SESSION_REFRESH_MARGIN", 600))
+SESSION_MIN_REFRESH_INTERVAL = float(os.getenv("SESSION_MIN_REFRESH_INTERVAL", 120))
+SESSION_REFRESH_BACKOFF_MAX = float(os.getenv("SESSION_REFRESH_BACKOFF_MAX", 1800))
+# Имена куки авторизации через запятую: по их сроку планируется упреждающее обновление.
+# Срок остальных куки (аналитика и т. п.) не учитывается; пусто — обновлять только после отказа сервера
+SESSION_COOKIE_NAMES = [name.strip() for name in os.getenv("SESSION_COOKIE_NAMES", "").split(",") if name.strip()]
+BROWSER_LOGIN_TIMEOUT = float(os.getenv("BROWSER_LOGIN_TIMEOUT", 60))
+# Воркеры опроса: JSON-список {"name", "cookies_file", "filter"}; без файла — один воркер
+WORKERS_FILE = os.getenv("WORKERS_FILE", "workers.json")
+
+# Публикация заявок в ATI: PUBLISH_ENABLED=1 включает отправку тел заявок в ATI_CARGOS_URL
+PUBLISH_ENABLED = os.getenv("PUBLISH_ENABLED", "0") == "1"
+PUBLISH_CONCURRENCY = int(os.getenv("PUBLISH_CONCURRENCY", 4))
+# Ограничение запросов к одному хосту: в секунду и допустимый всплеск
+PUBLISH_RATE_LIMIT = float(os.getenv("PUBLISH_RATE_LIMIT", 5))
+PUBLISH_RATE_BURST = int(os.getenv("PUBLISH_RATE_BURST", 10))
+# Очередь повторов: период проверки, аренда задачи, предел задержки и число попыток (секунды / штуки)
+PUBLISH_RETRY_INTERVAL = float(os.getenv("PUBLISH_RETRY_INTERVAL", 10))
+PUBLISH_LEASE = float(os.getenv("PUBLISH_LEASE", 120))
+PUBLISH_RETRY_MAX_DELAY = float(os.getenv("PUBLISH_RETRY_MAX_DELAY", 600))
+PUBLISH_MAX_ATTEMPTS = int(os.getenv("PUBLISH_MAX_ATTEMPTS", 20))
+
+# Конвейер через постоянные очереди: PIPELINE_MODE=1 разделяет выборку, сборку и запись на этапы
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "0") == "1"
+PIPELINE_QUEUE_FILE = os.getenv("PIPELINE_QUEUE_FILE", "pipeline_queue.sqlite")
+# Лотов за один проход этапа, аренда взятой пачки и пауза простаивающего этапа (секунды)
+PIPELINE_BATCH_SIZE = int(os.getenv("PIPELINE_BATCH_SIZE", 50))
+PIPELINE_LEASE = float(os.getenv("PIPELINE_LEASE", 300))
+PIPELINE_IDLE_WAIT = float(os.getenv("PIPELINE_IDLE_WAIT", 1))
+
+# Пересборка заявок из архива ответов BiddingsList (backfill.py): процессов (0 — по числу ядер),
+# файлов архива в одной задаче пула и файл результата
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", 0))
+BACKFILL_FILES_PER_TASK = int(os.getenv("BACKFILL_FILES_PER_TASK", 16))
+BACKFILL_OUTPUT_FILE = os.getenv("BACKFILL_OUTPUT_FILE", "backfill_requests.jsonl")
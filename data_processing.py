@@ -1,36 +1,136 @@
 # data_processing.py
 
 import json
+import logging
+from config import INCREMENTAL_MODE, DEFAULT_CARGO_NAME
 from logger import logger
+from transport_types import transport_types
+from geocode_cache import UNKNOWN_CITY_ID
+from lane_cache import lane_cache, Lane
+import metrics
 
-def create_route(way_points_data, cargo_weight, cargo_value):
-    if not way_points_data:
+try:
+    import orjson
+except ImportError:  # orjson опционален, без него используется json
+    orjson = None
+
+def collect_lot_changes(lots, processed_ids, incremental=INCREMENTAL_MODE, resolve_lanes=True):
+    """
+    Делит лоты страницы на новые и изменившиеся (по Lot.Version, только в инкрементальном режиме)
+    и собирает адреса их точек для пакетного геокодинга. Точки направлений из кэша
+    сразу получают city_id и блоки location, их адреса в геокодинг не уходят.
+    С resolve_lanes=False лоты только делятся (кэш направлений не трогается, адресов нет) —
+    для этапа, после которого лоты собирает другой этап.
+    Возвращает (новые лоты, изменившиеся лоты, адреса).
+    """
+    new_lots = []
+    changed_lots = []
+    addresses = []
+
+    for lot in lots:
+        lot_id = lot.id
+        if not incremental:
+            status = "unchanged" if lot_id in processed_ids else "new"
+        else:
+            version = lot.version
+            status = processed_ids.status(lot_id, version)
+            if status == "unchanged":
+                # Для ID, записанного без версии, запоминаем текущую как исходную
+                processed_ids.add(lot_id, version)
+
+        if status == "unchanged":
+            logger.debug("Заявка с ID %s уже обработана. Пропуск.", lot_id)
+            continue
+
+        (new_lots if status == "new" else changed_lots).append(lot)
+        if not resolve_lanes or apply_cached_lane(lot):
+            continue
+        for wp in lot.way_points:
+            addresses.append(wp.address)
+
+    if resolve_lanes and logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Кэш направлений: %s", lane_cache.stats())
+    return new_lots, changed_lots, addresses
+
+def apply_cached_lane(lot):
+    """Заполняет city_id и location точек лота из кэша направлений. True, если направление найдено."""
+    key = lot.lane
+    lane = lane_cache.get(key) if key is not None else None
+    if lane is None:
+        return False
+    for wp, city_id, location in zip(lot.way_points, lane.city_ids, lane.locations):
+        wp.city_id = city_id
+        wp.location = location
+    return True
+
+def _location(wp):
+    return {
+        "type": "manual",
+        "city_id": wp.city_id,
+        "address": wp.address
+    }
+
+def build_update_event(lot, request_body):
+    """Событие обновления для изменившегося лота вместо повторной заявки."""
+    return {
+        "event": "update",
+        "lot_id": lot.id,
+        "version": lot.version,
+        "request_body": request_body,
+    }
+
+@metrics.timed("build_request_body_seconds")
+def build_lot_request(lot, city_info_mapping):
+    """
+    Собирает тело заявки для записи Lot по готовому сопоставлению адрес -> city_id.
+    Полностью разрешенное направление запоминается в кэше направлений.
+    """
+    if lot.way_points and lot.way_points[0].location is None:
+        for wp in lot.way_points:
+            wp.city_id = city_info_mapping.get(wp.address, {}).get("city_id", UNKNOWN_CITY_ID)
+            wp.location = _location(wp)
+        key = lot.lane
+        # Нераспознанные адреса не кэшируем: после сбоя ATI направление должно разрешиться заново
+        if key is not None and all(wp.city_id != UNKNOWN_CITY_ID for wp in lot.way_points):
+            lane_cache.put(key, Lane(tuple(wp.city_id for wp in lot.way_points),
+                                     tuple(wp.location for wp in lot.way_points)))
+
+    # Вес, объем и название груза — из справочника типов транспорта
+    spec = transport_types.lookup(lot.transport_type_id, lot.transport_name, lot.transport_capacity)
+
+    # Создаем тело запроса по предсобранному шаблону
+    return fill_request_body(lot.id, lot.procedure_info.start_price, lot.procedure_info.step,
+                             lot.way_points, spec.weight, spec.volume, spec.cargo_name)
+
+def create_route(way_points, cargo_weight, cargo_value, cargo_name=DEFAULT_CARGO_NAME):
+    """Маршрут заявки ATI из записей WayPoint: первая точка — загрузка, последняя — выгрузка."""
+    if not way_points:
         return {}
 
-    loading_wp = way_points_data[0]
-    unloading_wp = way_points_data[-1]
+    loading_wp = way_points[0]
+    unloading_wp = way_points[-1]
 
     route = {
         "loading": {
             "type": "loading",
-            "city_id": loading_wp["CityId"],
+            "city_id": loading_wp.city_id,
             "location": {
                 "type": "manual",
-                "city_id": loading_wp["CityId"],
-                "address": loading_wp["Address"]
+                "city_id": loading_wp.city_id,
+                "address": loading_wp.address
             },
             "dates": {
                 "type": "ready",
                 "time": {
                     "type": "bounded",
-                    "start": loading_wp["Time"]
+                    "start": loading_wp.time
                 },
-                "first_date": loading_wp["Date"]
+                "first_date": loading_wp.date
             },
             "cargos": [
                 {
                     "id": 1,
-                    "name": "Любой закрытый",
+                    "name": cargo_name,
                     "weight": {
                         "type": "tons",
                         "quantity": cargo_weight
@@ -43,19 +143,19 @@ def create_route(way_points_data, cargo_weight, cargo_value):
         },
         "unloading": {
             "type": "unloading",
-            "city_id": unloading_wp["CityId"],
+            "city_id": unloading_wp.city_id,
             "location": {
                 "type": "manual",
-                "city_id": unloading_wp["CityId"],
-                "address": unloading_wp["Address"]
+                "city_id": unloading_wp.city_id,
+                "address": unloading_wp.address
             },
             "dates": {
                 "type": "ready",
                 "time": {
                     "type": "bounded",
-                    "start": unloading_wp["Time"]
+                    "start": unloading_wp.time
                 },
-                "first_date": unloading_wp["Date"]
+                "first_date": unloading_wp.date
             }
         },
         "is_round_trip": False
@@ -69,19 +169,19 @@ def create_request_body(lot_id, bet_start, bet_step, route, way_points):
     for wp in way_points:
         intermediate_wp = {
             "type": "intermediate",  # Можно уточнить тип, если требуется
-            "city_id": wp["CityId"],
+            "city_id": wp.city_id,
             "location": {
                 "type": "manual",
-                "city_id": wp["CityId"],
-                "address": wp["Address"]
+                "city_id": wp.city_id,
+                "address": wp.address
             },
             "dates": {
                 "type": "ready",
                 "time": {
                     "type": "bounded",
-                    "start": wp["Time"]
+                    "start": wp.time
                 },
-                "first_date": wp["Date"]
+                "first_date": wp.date
             }
         }
         intermediate_way_points.append(intermediate_wp)
@@ -155,3 +255,83 @@ def create_request_body(lot_id, bet_start, bet_step, route, way_points):
     }
 
     return request_body
+
+# Шаблон тела заявки: постоянные части (оплата, доски) берутся из create_request_body один раз
+# при импорте, так что правки в нем автоматически попадают и сюда. Вложенные словари шаблона
+# общие для всех заявок: тела только сериализуются, изменять их после сборки нельзя.
+_TEMPLATE_APPLICATION = create_request_body(None, None, None, {}, [])["cargo_application"]
+_PAYMENT_TEMPLATE = _TEMPLATE_APPLICATION["payment"]
+_BOARDS = _TEMPLATE_APPLICATION["boards"]
+
+def _route_point(point_type, wp):
+    return {
+        "type": point_type,
+        "city_id": wp.city_id,
+        "location": wp.location if wp.location is not None else _location(wp),
+        "dates": {
+            "type": "ready",
+            "time": {
+                "type": "bounded",
+                "start": wp.time
+            },
+            "first_date": wp.date
+        }
+    }
+
+def fill_route(way_points, cargo_weight, cargo_value, cargo_name=DEFAULT_CARGO_NAME):
+    """Быстрый аналог create_route: тот же результат без повторной сборки постоянных частей."""
+    if not way_points:
+        return {}
+
+    loading = _route_point("loading", way_points[0])
+    loading["cargos"] = [
+        {
+            "id": 1,
+            "name": cargo_name,
+            "weight": {
+                "type": "tons",
+                "quantity": cargo_weight
+            },
+            "volume": {
+                "quantity": cargo_value
+            }
+        }
+    ]
+    return {
+        "loading": loading,
+        "unloading": _route_point("unloading", way_points[-1]),
+        "is_round_trip": False
+    }
+
+def fill_request_body(lot_id, bet_start, bet_step, way_points, cargo_weight, cargo_value,
+                      cargo_name=DEFAULT_CARGO_NAME):
+    """
+    Быстрый аналог create_route + create_request_body: заполняет только поля конкретного лота,
+    постоянные части берутся из шаблона. Промежуточные точки — все, кроме первой и последней.
+    """
+    payment = _PAYMENT_TEMPLATE.copy()
+    payment["cash"] = bet_start
+    payment["start_rate"] = bet_start
+    payment["bid_step"] = bet_step
+    payment["rates"] = {
+        "cash": bet_start,
+        "rate_with_nds": bet_start,
+        "rate_without_nds": bet_start
+    }
+
+    return {
+        "cargo_application": {
+            "external_id": lot_id,
+            "route": fill_route(way_points, cargo_weight, cargo_value, cargo_name),
+            "way_points": [_route_point("intermediate", wp) for wp in way_points[1:-1]],
+            "payment": payment,
+            "boards": _BOARDS,
+            "note": lot_id
+        }
+    }
+
+def dumps_request_body(request_body):
+    """Компактная сериализация заявки в байты UTF-8: orjson, если установлен, иначе json."""
+    if orjson is not None:
+        return orjson.dumps(request_body)
+    return json.dumps(request_body, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
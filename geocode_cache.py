@@ -0,0 +1,123 @@
+# geocode_cache.py
+
+import sqlite3
+import threading
+import time
+from config import (
+    GEOCODE_CACHE_FILE,
+    GEOCODE_CACHE_TTL,
+    GEOCODE_CACHE_NEGATIVE_TTL,
+    GEOCODE_CACHE_MAX_ENTRIES,
+)
+from logger import logger
+import metrics
+
+UNKNOWN_CITY_ID = "Не указано"
+
+
+class GeocodeCache:
+    """Персистентный кэш адрес -> city_id поверх SQLite с TTL и вытеснением по размеру."""
+
+    def __init__(self, path=GEOCODE_CACHE_FILE, ttl=GEOCODE_CACHE_TTL,
+                 negative_ttl=GEOCODE_CACHE_NEGATIVE_TTL, max_entries=GEOCODE_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Колонка city_id без типа, чтобы SQLite сохранял и числа, и строки как есть
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS geocode (
+                address TEXT PRIMARY KEY,
+                city_id,
+                street TEXT,
+                is_success INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS geocode_last_used ON geocode (last_used)")
+        self._conn.commit()
+
+    def get_many(self, addresses):
+        """Возвращает (найденные записи, список адресов, которых нет в кэше)."""
+        now = time.time()
+        found = {}
+        with self._lock:
+            for address in addresses:
+                row = self._conn.execute(
+                    "SELECT city_id, street, is_success, expires_at FROM geocode WHERE address = ?",
+                    (address,),
+                ).fetchone()
+                if row is None or row[3] <= now:
+                    continue
+                found[address] = {"city_id": row[0], "street": row[1]}
+                if not row[2]:
+                    self.negative_hits += 1
+            if found:
+                self._conn.executemany(
+                    "UPDATE geocode SET last_used = ? WHERE address = ?",
+                    [(now, address) for address in found],
+                )
+                self._conn.commit()
+            self.hits += len(found)
+            missing = [address for address in addresses if address not in found]
+            self.misses += len(missing)
+        metrics.inc("geocode_cache_hits_total", len(found))
+        metrics.inc("geocode_cache_misses_total", len(missing))
+        return found, missing
+
+    def put_many(self, city_info_mapping, failed_addresses=()):
+        """Сохраняет результаты геокодинга. Неудачные адреса кэшируются на более короткий срок."""
+        now = time.time()
+        failed_addresses = set(failed_addresses)
+        rows = []
+        for address, info in city_info_mapping.items():
+            is_success = address not in failed_addresses
+            ttl = self.ttl if is_success else self.negative_ttl
+            rows.append((address, info.get("city_id", UNKNOWN_CITY_ID), info.get("street"),
+                         int(is_success), now + ttl, now))
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO geocode (address, city_id, street, is_success, expires_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now):
+        """Удаляет просроченные записи и самые давно использованные сверх лимита."""
+        self._conn.execute("DELETE FROM geocode WHERE expires_at <= ?", (now,))
+        (size,) = self._conn.execute("SELECT COUNT(*) FROM geocode").fetchone()
+        overflow = size - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM geocode WHERE address IN "
+                "(SELECT address FROM geocode ORDER BY last_used LIMIT ?)",
+                (overflow,),
+            )
+            logger.info("Из кэша геокодинга вытеснено %s записей.", overflow)
+
+    def stats(self):
+        """Счетчики попаданий и промахов кэша."""
+        with self._lock:
+            (size,) = self._conn.execute("SELECT COUNT(*) FROM geocode").fetchone()
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": size,
+        }
+
+
+geocode_cache = GeocodeCache()
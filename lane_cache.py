@@ -0,0 +1,67 @@
+# lane_cache.py
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from config import LANE_CACHE_SIZE
+import metrics
+
+
+@dataclass(slots=True)
+class Lane:
+    """Разрешенное направление: city_id и готовые блоки location по точкам маршрута."""
+
+    city_ids: tuple
+    locations: tuple
+
+
+class LaneCache:
+    """
+    LRU-кэш направлений по упорядоченному кортежу Point.ID точек маршрута.
+    Повторяющемуся направлению не нужен геокодинг, а блоки location берутся готовыми —
+    в заявке заполняются только даты, время и цена. Блоки общие для всех заявок направления
+    и после сборки не изменяются (тела только сериализуются).
+    """
+
+    def __init__(self, max_entries=LANE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lanes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Lane по ключу направления или None."""
+        with self._lock:
+            lane = self._lanes.get(key)
+            if lane is None:
+                self.misses += 1
+            else:
+                self._lanes.move_to_end(key)
+                self.hits += 1
+        metrics.inc("lane_cache_total", result="miss" if lane is None else "hit")
+        return lane
+
+    def put(self, key, lane):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._lanes[key] = lane
+            self._lanes.move_to_end(key)
+            while len(self._lanes) > self.max_entries:
+                self._lanes.popitem(last=False)
+
+    def stats(self):
+        """Счетчики повторного использования направлений."""
+        with self._lock:
+            size = len(self._lanes)
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": size,
+        }
+
+
+lane_cache = LaneCache()
@@ -1,10 +1,85 @@
 # logger.py
 
+import atexit
+import copy
+import json
 import logging
-from config import LOG_LEVEL, LOG_FORMAT
+import logging.handlers
+import queue
+from config import LOG_LEVEL, LOG_FORMAT, LOG_JSON, LOG_FILE, LOG_QUEUE
+
+# Атрибуты, которые есть у любой LogRecord; все остальное пришло через extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись: время, уровень, сообщение и поля, переданные через extra."""
+
+    def format(self, record):
+        payload = {
+            "ts": f"{self.formatTime(record, '%Y-%m-%dT%H:%M:%S')}.{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                payload[key] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # Запись прошла через LogQueueHandler: трассировка уже отформатирована
+            payload["exc"] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler, который не вклеивает трассировку в сообщение: она форматируется в exc_text
+    до постановки в очередь, и JsonFormatter выводит ее отдельным полем exc.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            # Трассировка с кадрами стека не нужна слушателю и держит их в памяти до записи
+            record.exc_info = None
+        return record
+
+
+def _make_handlers():
+    formatter = JsonFormatter() if LOG_JSON else logging.Formatter(LOG_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if LOG_FILE:
+        handlers.append(logging.FileHandler(LOG_FILE, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
 
 def setup_logger():
-    logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
+    handlers = _make_handlers()
+    if LOG_QUEUE:
+        # Запись в консоль и файл идет в отдельном потоке, цикл опроса только кладет запись в очередь
+        log_queue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)
+        handlers = [LogQueueHandler(log_queue)]
+    logging.basicConfig(level=LOG_LEVEL, handlers=handlers)
     return logging.getLogger(__name__)
 
+
 logger = setup_logger()
+
+
+def log_poll_summary(summary):
+    """Одна строка итогов опроса вместо строки на каждый лот. Поля также уходят в extra для JSON."""
+    logger.info(
+        "Опрос %s: страниц %s, лотов %s, новых %s, изменилось %s, пропущено %s, %.2f с.",
+        summary["worker"], summary["pages"], summary["seen"], summary["new"], summary["changed"],
+        summary["seen"] - summary["new"] - summary["changed"], summary["duration"], extra={"poll": summary},
+    )
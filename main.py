@@ -1,116 +1,150 @@
 # main.py
 
 import json
-import os
+import threading
 import time
-from logger import logger
-from selenium_utils import get_cookies_from_selenium
-from api_client import send_post_request, get_city_ids
-from data_processing import create_route, create_request_body
-from storage import load_processed_ids, save_processed_ids, save_all_requests_to_json
-from config import AUTHORIZATION_TOKEN
-
-def process_requests(cookies, authorization_token, processed_ids):
-    json_response = send_post_request(cookies, authorization_token)
-    if not json_response:
-        logger.error("Не удалось получить ответ от API. Пропуск итерации.")
-        return
-
+from logger import logger, log_poll_summary
+from session_manager import SessionManager
+from api_client import AuthError, iter_lot_pages, get_city_ids
+from data_processing import collect_lot_changes
+from storage import ProcessedIdStore, save_new_requests
+from polling import commit_page, finish_poll
+from publisher import get_publisher, publish_requests, close_publisher
+import metrics
+from scheduler import PollScheduler, new_poll_summary, merge_auction_timing
+from workers import load_workers, default_worker
+from pipeline import Pipeline
+from config import AUTHORIZATION_TOKEN, ASYNC_MODE, PIPELINE_MODE, PRINT_NEW_REQUESTS
+
+def process_requests(cookies, authorization_token, processed_ids, worker=None, pages=None):
+    """
+    Обрабатывает один опрос воркера и возвращает его итоги для планировщика.
+    pages — готовые страницы лотов (например, из архива в replay.py) вместо запроса к GraphQL API.
+    """
+    worker = worker or default_worker()
+    summary = new_poll_summary()
+    summary["worker"] = worker["name"]
+    started = time.perf_counter()
     new_requests = []
 
-    for lot in json_response.get("data", {}).get("Lots", []):
-        lot_id = lot.get("ID")
-        if lot_id in processed_ids:
-            logger.info(f"Заявка с ID {lot_id} уже обработана. Пропуск.")
-            continue
-
-        # Извлечение необходимых данных
-        bet_start = lot.get("ProcedureInfo", {}).get("StartPrice")
-        bet_step = lot.get("ProcedureInfo", {}).get("Step")
-        transport_type = lot.get("TransportType", {})
-        cargo_weight = transport_type.get("Name", "").split('т')[0]  # до первой буквы 'т'
-        cargo_value = transport_type.get("Capacity", "").split('.')[0]  # до знака точки
-
-        # Обработка WayPoints
-        way_points = lot.get("Route", {}).get("WayPoints", [])
-        way_points_data = []
-        addresses = []
-
-        for wp in way_points:
-            arrival_at = wp.get("ArrivalAt", "")
-            date = arrival_at.split("T")[0] if arrival_at else ""
-            time_str = arrival_at.split("T")[1].split("Z")[0] if arrival_at else ""
-            address = wp.get("Point", {}).get("Address", "")
-            addresses.append(address)
-
-        # Получаем city_id для всех уникальных адресов
-        city_info_mapping = get_city_ids(addresses)
-
-        for wp in way_points:
-            address = wp.get("Point", {}).get("Address", "")
-            city_id = city_info_mapping.get(address, {}).get("city_id", "Не указано")
-
-            way_points_data.append({
-                "Date": date,
-                "Time": time_str,
-                "Address": address,
-                "CityId": city_id
-            })
-
-        # Создаем маршрут
-        route = create_route(way_points_data, cargo_weight, cargo_value)
-
-        # Извлекаем way_points, исключая первый и последний элементы
-        way_points_list = way_points_data[1:-1]  # Все точки, кроме первой и последней
-
-        # Создаем тело запроса
-        request_body = create_request_body(lot_id, bet_start, bet_step, route, way_points_list)
-
-        # Добавляем request_body в список новых заявок
-        new_requests.append(request_body)
-
-        # Добавляем lot_id в processed_ids
-        processed_ids.add(lot_id)
-        logger.info(f"Заявка с ID {lot_id} обработана и добавлена в processed_ids.")
-
-    # Сохраняем все новые заявки
-    if new_requests:
-        save_all_requests_to_json(new_requests)
-        save_processed_ids(processed_ids)
-    else:
-        logger.info("Нет новых заявок для обработки.")
+    # Страницы обрабатываются по мере поступления, следующая подгружается в фоне
+    try:
+        if pages is None:
+            pages = iter_lot_pages(cookies, lots_filter=worker["filter"])
+        for lots in pages:
+            summary["pages"] += 1
+            summary["seen"] += len(lots)
+            merge_auction_timing(summary, lots)
+
+            # Фаза 1: отбираем новые и изменившиеся лоты страницы и собираем адреса всех их точек
+            new_lots, changed_lots, addresses = collect_lot_changes(lots, processed_ids)
+
+            # Фаза 2: один (или несколько по GEOCODE_CHUNK_SIZE) запрос к ATI на всю страницу
+            city_info_mapping = get_city_ids(addresses) if addresses else {}
+
+            # Фаза 3: собираем тела заявок и пишем их; дубли на следующих страницах
+            # и лоты, которые успел записать другой воркер, будут пропущены.
+            # Изменившиеся лоты уходят событием обновления, а не повторной заявкой
+            new_requests.extend(commit_page(new_lots, changed_lots, city_info_mapping, processed_ids, summary))
+    except AuthError as e:
+        # Уже обработанные страницы сохраняются как обычно, куки обновит вызывающий код
+        logger.error("Сервер отклонил куки: %s", e)
+        summary["auth_failed"] = True
+
+    if not finish_poll(summary, worker, started):
+        return summary
+
+    # Сохраняем все новые заявки и только затем отдаем их на публикацию
+    save_new_requests(new_requests, processed_ids)
+    publish_requests(new_requests)
+
+    log_poll_summary(summary)
 
     # Выводим структуру новых заявок для проверки
-    if new_requests:
+    if new_requests and PRINT_NEW_REQUESTS:
         print(json.dumps(new_requests, ensure_ascii=False, indent=4))
 
-def main():
+    return summary
+
+def run_worker(worker, processed_ids, stop_event, pipeline=None):
+    """
+    Цикл опроса одного воркера со своими куки, фильтром и планировщиком.
+    С pipeline воркер только выбирает лоты в очередь, остальное делают этапы конвейера.
+    """
+    scheduler = PollScheduler()
+    # Куки держатся в памяти и обновляются через один и тот же браузер
+    session = SessionManager(cookies_file=worker["cookies_file"])
     try:
-        while True:
-            logger.info("Запуск обработки заявок.")
-            # Проверяем наличие куки
-            if os.path.exists("cookies.json"):
-                with open("cookies.json", "r", encoding="utf-8") as f:
-                    cookies = json.load(f)
-                logger.info("Куки загружены из файла.")
-            else:
-                cookies = get_cookies_from_selenium()
+        while not stop_event.is_set():
+            scheduler.start_poll()
+            logger.info("Запуск обработки заявок (%s).", worker["name"])
+            # Куки из памяти; браузер запускается, только если они устарели
+            cookies = session.get_cookies()
 
             # Укажите ваш токен авторизации
             authorization_token = AUTHORIZATION_TOKEN  # Замените на ваш токен или получите из config
 
-            # Загружаем обработанные ID
-            processed_ids = load_processed_ids()
-
             # Отправляем запрос и обрабатываем заявки
-            process_requests(cookies, authorization_token, processed_ids)
+            if pipeline is not None:
+                summary = pipeline.fetch(cookies, worker)
+            else:
+                summary = process_requests(cookies, authorization_token, processed_ids, worker)
+
+            # Отклоненные куки обновляем сразу и повторяем опрос без паузы
+            if summary["auth_failed"] and session.invalidate():
+                logger.info("Повтор опроса с обновленными куки.")
+                continue
+
+            # Пауза считается от старта текущего опроса, а не от его окончания
+            delay = scheduler.next_delay(summary)
+            metrics.log_summary_if_due()
+            logger.info("Завершена обработка заявок (%s). Ожидание %.0f секунд.", worker["name"], delay)
+            stop_event.wait(delay)
+    except Exception as e:
+        logger.error("Неожиданная ошибка в воркере %s: %s", worker["name"], e)
+    finally:
+        session.close()
 
-            logger.info("Завершена обработка заявок. Ожидание 60 секунд.")
-            time.sleep(60)  # Ждем 60 секунд перед следующим запуском
+def main():
+    if ASYNC_MODE:
+        from async_engine import run_async
+        run_async()
+        return
+
+    metrics.start_metrics_server()
+    # Обработанные ID читаются с диска один раз, дальше живут в памяти и общие для всех воркеров
+    processed_ids = ProcessedIdStore()
+    workers = load_workers()
+    # Публикатор поднимается заранее, чтобы дослать заявки из очереди прошлого запуска
+    get_publisher()
+    stop_event = threading.Event()
+    pipeline = Pipeline(processed_ids) if PIPELINE_MODE else None
+    threads = [
+        threading.Thread(target=run_worker, args=(worker, processed_ids, stop_event, pipeline),
+                         name=worker["name"], daemon=True)
+        for worker in workers
+    ]
+    stage_threads = []
+    try:
+        if pipeline is not None:
+            # Этапы сразу начинают с задач, оставшихся в очередях после прошлого запуска
+            stage_threads = pipeline.start(stop_event)
+        for thread in threads:
+            thread.start()
+        # Главный поток только ждет воркеров, чтобы принимать Ctrl+C
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=1)
     except KeyboardInterrupt:
         logger.info("Программа остановлена пользователем.")
     except Exception as e:
-        logger.error(f"Неожиданная ошибка: {e}")
+        logger.error("Неожиданная ошибка: %s", e)
+    finally:
+        stop_event.set()
+        for thread in threads + stage_threads:
+            if thread.is_alive():
+                thread.join()
+        close_publisher()
 
 if __name__ == "__main__":
     main()
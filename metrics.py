@@ -0,0 +1,179 @@
+# metrics.py
+
+import asyncio
+import contextlib
+import functools
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from config import METRICS_ENABLED, METRICS_HOST, METRICS_PORT, METRICS_SUMMARY_INTERVAL
+from logger import logger
+
+# Границы корзин гистограмм длительности, секунды
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_NULL_TIMER = contextlib.nullcontext()
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class MetricsRegistry:
+    """Счетчики и гистограммы в памяти с выгрузкой в текстовом формате Prometheus."""
+
+    def __init__(self):
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._last_summary = time.monotonic()
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(DEFAULT_BUCKETS)
+            histogram.observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def render(self):
+        """Текст для /metrics в формате Prometheus exposition."""
+        lines = []
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum:.6f}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """Короткая строка со счетчиками и средними длительностями этапов."""
+        with self._lock:
+            parts = [f"{name}{_format_labels(labels)}={value}" for (name, labels), value in sorted(self._counters.items())]
+            parts += [
+                f"{name}{_format_labels(labels)}={histogram.sum / histogram.count * 1000:.2f}ms/{histogram.count}"
+                for (name, labels), histogram in sorted(self._histograms.items()) if histogram.count
+            ]
+        return " ".join(parts)
+
+    def log_summary_if_due(self, interval=METRICS_SUMMARY_INTERVAL):
+        now = time.monotonic()
+        if now - self._last_summary < interval:
+            return
+        self._last_summary = now
+        logger.info("Метрики: %s", self.summary())
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+registry = MetricsRegistry()
+
+
+# Функции ниже — точки инструментирования. При выключенных метриках они ничего не делают,
+# а timed возвращает функцию без обертки, так что горячий путь не платит за метрики.
+
+def inc(name, amount=1, **labels):
+    if METRICS_ENABLED:
+        registry.inc(name, amount, **labels)
+
+
+def observe(name, value, **labels):
+    if METRICS_ENABLED:
+        registry.observe(name, value, **labels)
+
+
+def timer(name, **labels):
+    """Контекстный менеджер, записывающий длительность блока в гистограмму name."""
+    if not METRICS_ENABLED:
+        return _NULL_TIMER
+    return registry.timer(name, **labels)
+
+
+def timed(name, **labels):
+    """Декоратор: длительность вызова функции (в том числе async) в гистограмму name."""
+    def decorator(func):
+        if not METRICS_ENABLED:
+            return func
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with registry.timer(name, **labels):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with registry.timer(name, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def log_summary_if_due():
+    if METRICS_ENABLED:
+        registry.log_summary_if_due()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        data = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(host=METRICS_HOST, port=METRICS_PORT):
+    """Поднимает локальный /metrics в фоновом потоке, если метрики включены и задан порт."""
+    if not METRICS_ENABLED or not port:
+        return None
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info("Метрики доступны на http://%s:%s/metrics", host, server.server_port)
+    return server
@@ -0,0 +1,115 @@
+# models.py
+
+import re
+from dataclasses import dataclass, field
+
+# ArrivalAt вида 2024-10-10T06:00:00Z (доли секунды и смещение отбрасываются)
+_ARRIVAL_AT_RE = re.compile(r"(\d{4}-\d{2}-\d{2})T(\d{2}:\d{2}(?::\d{2})?)")
+
+
+def split_arrival_at(arrival_at):
+    """Дата и время точки из ArrivalAt: ("2024-10-10", "06:00:00"). Пустые строки, если значения нет."""
+    if not arrival_at:
+        return "", ""
+    match = _ARRIVAL_AT_RE.match(arrival_at)
+    if match is not None:
+        return match.group(1), match.group(2)
+    date, _, time_str = arrival_at.partition("T")
+    return date, time_str.partition("Z")[0]
+
+
+@dataclass(slots=True)
+class WayPoint:
+    arrival_at: str = ""
+    address: str = ""
+    date: str = ""
+    time: str = ""
+    point_id: object = None
+    # Заполняются при сборке заявки: из сопоставления адрес -> city_id или из кэша направлений
+    city_id: object = "Не указано"
+    location: dict = None
+
+
+@dataclass(slots=True)
+class ProcedureInfo:
+    start_price: object = None
+    step: object = None
+
+
+@dataclass(slots=True)
+class Lot:
+    """
+    Лот BiddingsList: только поля, которые читает обработка.
+    Вместо вложенного dict на каждый уровень ответа — одна запись с атрибутами.
+    """
+
+    id: object = None
+    version: object = None
+    bidding_duration: object = None
+    countdown: object = None
+    procedure_info: ProcedureInfo = field(default_factory=ProcedureInfo)
+    transport_type_id: object = None
+    transport_name: str = ""
+    transport_capacity: str = ""
+    way_points: list = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, lot):
+        """Запись из лота в виде ответа GraphQL за один проход, включая даты точек."""
+        procedure_info = lot.get("ProcedureInfo") or {}
+        transport_type = lot.get("TransportType") or {}
+        way_points = []
+        for wp in (lot.get("Route") or {}).get("WayPoints") or []:
+            arrival_at = wp.get("ArrivalAt") or ""
+            date, time_str = split_arrival_at(arrival_at)
+            point = wp.get("Point") or {}
+            way_points.append(WayPoint(arrival_at, point.get("Address", ""), date, time_str, point.get("ID")))
+        return cls(
+            id=lot.get("ID"),
+            version=lot.get("Version"),
+            bidding_duration=lot.get("BiddingDurationSeconds"),
+            countdown=(lot.get("Auction") or {}).get("Countdown"),
+            procedure_info=ProcedureInfo(procedure_info.get("StartPrice"), procedure_info.get("Step")),
+            transport_type_id=transport_type.get("ID"),
+            transport_name=transport_type.get("Name") or "",
+            transport_capacity=transport_type.get("Capacity") or "",
+            way_points=way_points,
+        )
+
+    @property
+    def lane(self):
+        """Ключ направления: упорядоченные Point.ID точек маршрута. None, если у точки нет ID."""
+        lane = tuple(wp.point_id for wp in self.way_points)
+        if not lane or None in lane:
+            return None
+        return lane
+
+    def to_dict(self):
+        """Лот обратно в виде ответа GraphQL (для очередей и архивов)."""
+        return {
+            "ID": self.id,
+            "Version": self.version,
+            "BiddingDurationSeconds": self.bidding_duration,
+            "Auction": {"Countdown": self.countdown},
+            "ProcedureInfo": {"StartPrice": self.procedure_info.start_price, "Step": self.procedure_info.step},
+            "TransportType": {
+                "ID": self.transport_type_id, "Name": self.transport_name, "Capacity": self.transport_capacity
+            },
+            "Route": {
+                "WayPoints": [
+                    {"ArrivalAt": wp.arrival_at, "Point": {"ID": wp.point_id, "Address": wp.address}}
+                    for wp in self.way_points
+                ]
+            },
+        }
+
+
+class LotsPage:
+    """Разобранный ответ BiddingsList: записи лотов и GraphQL errors."""
+
+    __slots__ = ("lots", "errors", "has_data")
+
+    def __init__(self, lots=None, errors=None, has_data=False):
+        self.lots = lots if lots is not None else []
+        self.errors = errors or []
+        self.has_data = has_data
@@ -0,0 +1,153 @@
+# pipeline.py
+
+import threading
+import time
+from config import PIPELINE_QUEUE_FILE, PIPELINE_BATCH_SIZE, PIPELINE_LEASE, PIPELINE_IDLE_WAIT
+from logger import logger, log_poll_summary
+from api_client import AuthError, iter_lot_pages, get_city_ids
+from data_processing import collect_lot_changes, build_lot_request, build_update_event
+from storage import DurableQueue, commit_lot_request, save_new_requests
+from publisher import publish_requests
+from scheduler import new_poll_summary, merge_auction_timing
+from polling import finish_poll
+from workers import default_worker
+from models import Lot
+import metrics
+
+
+def lot_key(lot):
+    """Ключ задачи в очередях: одна версия лота обрабатывается один раз."""
+    return f"{lot.id}:{lot.version}"
+
+
+class Pipeline:
+    """
+    Обработка лотов тремя этапами через постоянные очереди SQLite:
+    выборка -> очередь lots -> геокодинг и сборка тел -> очередь built -> запись и публикация.
+    Каждый этап берет задачи пачками и подтверждает их только после передачи дальше.
+    Файл очередей принадлежит одному процессу, поэтому при старте аренды прошлого запуска
+    снимаются и незавершенные пачки обрабатываются сразу.
+    Повторная обработка безопасна: запись идет через commit_lot_request, который
+    пропускает уже записанную версию лота.
+    """
+
+    def __init__(self, processed_ids, path=PIPELINE_QUEUE_FILE, batch_size=PIPELINE_BATCH_SIZE,
+                 lease=PIPELINE_LEASE):
+        self.processed_ids = processed_ids
+        self.batch_size = batch_size
+        self.lease = lease
+        self.lots = DurableQueue(path, "lots")
+        self.built = DurableQueue(path, "built")
+        self.lots.release_leases()
+        self.built.release_leases()
+        # Этап будится сразу, как только предыдущий положил задачи, а не по таймеру
+        self._lots_ready = threading.Event()
+        self._built_ready = threading.Event()
+
+    def fetch(self, cookies, worker=None):
+        """Этап 1: выборка страниц лотов воркера в очередь lots. Возвращает итоги опроса."""
+        worker = worker or default_worker()
+        summary = new_poll_summary()
+        summary["worker"] = worker["name"]
+        started = time.perf_counter()
+
+        try:
+            for lots in iter_lot_pages(cookies, lots_filter=worker["filter"]):
+                summary["pages"] += 1
+                summary["seen"] += len(lots)
+                merge_auction_timing(summary, lots)
+                # Направления разрешает этап enrich: здесь кэш не трогаем, чтобы не считать лот дважды
+                new_lots, changed_lots, _ = collect_lot_changes(lots, self.processed_ids, resolve_lanes=False)
+                new_keys = {lot_key(lot) for lot in new_lots}
+                # Лоты, уже собранные, но еще не записанные, второй раз в очередь не ставим
+                candidates = {lot_key(lot): lot for lot in new_lots + changed_lots}
+                in_flight = self.built.pending_keys(candidates)
+                # В очереди лот хранится в виде ответа GraphQL
+                added = self.lots.put_many(
+                    [(key, lot.to_dict()) for key, lot in candidates.items() if key not in in_flight]
+                )
+                for _, key, _ in added:
+                    summary["new" if key in new_keys else "changed"] += 1
+                if added:
+                    self._lots_ready.set()
+        except AuthError as e:
+            logger.error("Сервер отклонил куки: %s", e)
+            summary["auth_failed"] = True
+
+        if finish_poll(summary, worker, started):
+            log_poll_summary(summary)
+        return summary
+
+    @metrics.timed("pipeline_stage_seconds", stage="enrich")
+    def enrich_batch(self):
+        """Этап 2: геокодинг и сборка тел для пачки из lots в очередь built. Возвращает размер пачки."""
+        items = self.lots.claim(self.batch_size, self.lease)
+        if not items:
+            return 0
+
+        # Лот мог быть записан до падения, а задача не подтверждена — такие отсеются здесь
+        new_lots, changed_lots, addresses = collect_lot_changes(
+            [Lot.from_dict(lot) for _, _, lot in items], self.processed_ids
+        )
+        city_info_mapping = get_city_ids(addresses) if addresses else {}
+
+        built = []
+        for lot in new_lots:
+            built.append((lot, build_lot_request(lot, city_info_mapping)))
+        for lot in changed_lots:
+            built.append((lot, build_update_event(lot, build_lot_request(lot, city_info_mapping))))
+        self.built.put_many([
+            (lot_key(lot), {"lot_id": lot.id, "version": lot.version, "record": record})
+            for lot, record in built
+        ])
+        self.lots.ack_many([item_id for item_id, _, _ in items])
+        metrics.inc("pipeline_items_total", len(items), stage="enrich")
+        logger.debug("Собрано тел заявок: %s из %s лотов.", len(built), len(items))
+        if built:
+            self._built_ready.set()
+        return len(items)
+
+    @metrics.timed("pipeline_stage_seconds", stage="persist")
+    def persist_batch(self):
+        """Этап 3: запись пачки из built в request_sink, фиксация ID и публикация. Возвращает размер пачки."""
+        items = self.built.claim(self.batch_size, self.lease)
+        if not items:
+            return 0
+
+        new_requests = []
+        for _, _, item in items:
+            if commit_lot_request(item["record"], item["lot_id"], item["version"], self.processed_ids):
+                new_requests.append(item["record"])
+        save_new_requests(new_requests, self.processed_ids)
+        publish_requests(new_requests)
+        self.built.ack_many([item_id for item_id, _, _ in items])
+        metrics.inc("pipeline_items_total", len(items), stage="persist")
+        return len(items)
+
+    def run_stage(self, stage, ready, stop_event):
+        """Крутит этап, пока есть задачи; в простое ждет сигнала от предыдущего этапа."""
+        name = stage.__name__
+        while not stop_event.is_set():
+            try:
+                processed = stage()
+            except Exception as e:
+                logger.error("Ошибка на этапе %s: %s", name, e)
+                processed = 0
+            if not processed:
+                ready.wait(PIPELINE_IDLE_WAIT)
+                ready.clear()
+
+    def start(self, stop_event):
+        """Запускает этапы сборки и записи в фоновых потоках. Выборку ведут воркеры через fetch."""
+        threads = [
+            threading.Thread(target=self.run_stage, args=(self.enrich_batch, self._lots_ready, stop_event),
+                             name="pipeline-enrich", daemon=True),
+            threading.Thread(target=self.run_stage, args=(self.persist_batch, self._built_ready, stop_event),
+                             name="pipeline-persist", daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def stats(self):
+        return {"lots": self.lots.stats(), "built": self.built.stats()}
@@ -0,0 +1,52 @@
+# polling.py
+#
+# Общие шаги одного опроса для всех движков: main.process_requests,
+# async_engine.async_process_requests и pipeline.Pipeline.fetch.
+
+import time
+from logger import logger
+from data_processing import build_lot_request, build_update_event
+from storage import commit_lot_request
+import metrics
+
+
+def commit_page(new_lots, changed_lots, city_info_mapping, processed_ids, summary):
+    """
+    Собирает и записывает заявки страницы: новые лоты — заявкой, изменившиеся — событием
+    обновления. Лоты, которые успел записать другой воркер, пропускаются.
+    Счетчики new/changed в summary растут только на записанные. Возвращает записанные тела.
+    """
+    records = []
+    for lot in new_lots:
+        request_body = build_lot_request(lot, city_info_mapping)
+        if not commit_lot_request(request_body, lot.id, lot.version, processed_ids):
+            continue
+        records.append(request_body)
+        logger.debug("Заявка с ID %s обработана и добавлена в processed_ids.", lot.id)
+        summary["new"] += 1
+
+    for lot in changed_lots:
+        event = build_update_event(lot, build_lot_request(lot, city_info_mapping))
+        if not commit_lot_request(event, lot.id, lot.version, processed_ids):
+            continue
+        records.append(event)
+        summary["changed"] += 1
+    return records
+
+
+def finish_poll(summary, worker, started):
+    """
+    Закрывает итоги опроса: отметка успеха, длительность и счетчики лотов воркера.
+    False, если не получено ни одной страницы.
+    """
+    if not summary["pages"]:
+        logger.error("Не удалось получить ответ от API. Пропуск итерации.")
+        return False
+    summary["ok"] = True
+    summary["duration"] = time.perf_counter() - started
+    name = worker["name"]
+    metrics.inc("lots_seen_total", summary["seen"], worker=name)
+    metrics.inc("lots_new_total", summary["new"], worker=name)
+    metrics.inc("lots_changed_total", summary["changed"], worker=name)
+    metrics.inc("lots_skipped_total", summary["seen"] - summary["new"] - summary["changed"], worker=name)
+    return True
@@ -0,0 +1,210 @@
+# publisher.py
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+import requests
+from config import (
+    ATI_CARGOS_URL, PUBLISH_ENABLED, PUBLISH_CONCURRENCY, PUBLISH_RATE_LIMIT, PUBLISH_RATE_BURST,
+    PUBLISH_RETRY_INTERVAL, PUBLISH_LEASE, PUBLISH_RETRY_MAX_DELAY, PUBLISH_MAX_ATTEMPTS,
+    PUBLISHED_IDS_LOG, PUBLISH_QUEUE_FILE,
+)
+from logger import logger
+from api_client import request_with_retries, ati_headers, RETRY_STATUS_CODES, AUTH_STATUS_CODES
+from storage import ProcessedIdStore, DurableQueue
+import metrics
+
+
+class TokenBucket:
+    """Ограничитель частоты: rate запросов в секунду со всплеском до burst."""
+
+    def __init__(self, rate=PUBLISH_RATE_LIMIT, burst=PUBLISH_RATE_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Ждет, пока появится свободный токен."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+def host_bucket(url):
+    """Общий TokenBucket для хоста из url."""
+    host = urlsplit(url).netloc
+    with _buckets_lock:
+        bucket = _buckets.get(host)
+        if bucket is None:
+            bucket = _buckets[host] = TokenBucket()
+    return bucket
+
+
+class Publisher:
+    """
+    Отправка тел заявок в ATI пулом потоков.
+    Каждая заявка сначала попадает в постоянную очередь (ключ — external_id), затем уходит
+    в пул. Неудачи откладываются в той же очереди с растущей задержкой, опубликованные
+    external_id записываются в отдельное хранилище и повторно не отправляются.
+    Каждый POST уходит один раз с заголовком Idempotency-Key = external_id: если ответ
+    потерялся, повтор из очереди не создаст в ATI второй груз.
+    """
+
+    def __init__(self, url=ATI_CARGOS_URL, concurrency=PUBLISH_CONCURRENCY, queue=None, published=None):
+        self.url = url
+        self.concurrency = concurrency
+        self.queue = queue or DurableQueue(PUBLISH_QUEUE_FILE, "publish")
+        # Пустое хранилище ложно по len(), поэтому сравнение с None, а не or
+        if published is None:
+            published = ProcessedIdStore(PUBLISHED_IDS_LOG, legacy_path=None, label="опубликованных")
+        self.published = published
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="ati-publish")
+        self._stop = threading.Event()
+        # external_id, отданные пулу и еще не завершенные: аренда в очереди могла истечь,
+        # пока задача ждала свободный поток, но повторно брать ее нельзя
+        self._in_flight = set()
+        self._in_flight_lock = threading.Lock()
+        # Задачи, взятые прошлым запуском и не завершенные им, возвращаются в очередь и отправляются
+        # сразу; отложенные повторы ждут своего времени
+        self.queue.release_leases()
+        self.dispatch_due()
+        self._retry_thread = threading.Thread(target=self._retry_loop, name="ati-publish-retry", daemon=True)
+        self._retry_thread.start()
+
+    def submit(self, request_bodies):
+        """Ставит заявки в очередь и сразу отдает их пулу. Возвращает число поставленных."""
+        items = []
+        for request_body in request_bodies:
+            if request_body.get("event") == "update":
+                # Правка уже опубликованного груза требует ID груза в ATI, которого у нас нет
+                logger.debug("Событие обновления лота %s не публикуется.", request_body.get("lot_id"))
+                continue
+            external_id = request_body["cargo_application"]["external_id"]
+            if external_id not in self.published:
+                items.append((external_id, request_body))
+
+        added = self.queue.put_many(items, lease=PUBLISH_LEASE)
+        self._start(added)
+        return len(added)
+
+    def dispatch_due(self):
+        """Отдает пулу задачи очереди, у которых наступило время повтора, кроме еще выполняющихся."""
+        with self._in_flight_lock:
+            in_flight = list(self._in_flight)
+        self._start(self.queue.claim(self.concurrency * 4, PUBLISH_LEASE, exclude=in_flight))
+
+    def _start(self, items):
+        for item_id, external_id, request_body in items:
+            with self._in_flight_lock:
+                if str(external_id) in self._in_flight:
+                    continue
+                self._in_flight.add(str(external_id))
+            self._executor.submit(self._publish, item_id, external_id, request_body)
+
+    def _retry_loop(self):
+        while not self._stop.wait(PUBLISH_RETRY_INTERVAL):
+            try:
+                self.dispatch_due()
+            except Exception as e:
+                logger.error("Ошибка при выборке очереди публикации: %s", e)
+
+    def _publish(self, item_id, external_id, request_body):
+        try:
+            self._publish_once(item_id, external_id, request_body)
+        finally:
+            with self._in_flight_lock:
+                self._in_flight.discard(str(external_id))
+
+    def _publish_once(self, item_id, external_id, request_body):
+        if external_id in self.published:
+            self.queue.ack(item_id)
+            return
+        try:
+            host_bucket(self.url).acquire()
+            with metrics.timer("ati_publish_seconds"):
+                # Без повторов внутри запроса: POST мог дойти до ATI, даже если ответа нет.
+                # Все повторы — через очередь, с тем же Idempotency-Key
+                headers = {**ati_headers(), "Idempotency-Key": str(external_id)}
+                response = request_with_retries("POST", self.url, headers=headers, json=request_body,
+                                                max_retries=0)
+        except requests.RequestException as e:
+            self._retry(item_id, external_id, repr(e))
+            return
+        except Exception as e:
+            logger.exception("Неожиданная ошибка публикации заявки %s.", external_id)
+            self._retry(item_id, external_id, repr(e))
+            return
+
+        status = response.status_code
+        # 409 — груз с таким external_id или Idempotency-Key уже есть в ATI
+        if 200 <= status < 300 or status == 409:
+            self.published.add(external_id)
+            self.published.flush()
+            self.queue.ack(item_id)
+            metrics.inc("ati_publish_total", result="ok")
+            logger.info("Заявка %s опубликована в ATI (%s).", external_id, status)
+        elif status in RETRY_STATUS_CODES or status in AUTH_STATUS_CODES:
+            self._retry(item_id, external_id, f"{status}: {response.text[:500]}")
+        else:
+            # Ошибка в самой заявке: повтор ничего не изменит
+            self.queue.fail(item_id, f"{status}: {response.text[:500]}")
+            metrics.inc("ati_publish_total", result="rejected")
+            logger.error("ATI отклонил заявку %s: %s - %s", external_id, status, response.text)
+
+    def _retry(self, item_id, external_id, error):
+        attempts = self.queue.attempts(item_id)
+        if attempts >= PUBLISH_MAX_ATTEMPTS:
+            self.queue.fail(item_id, error)
+            metrics.inc("ati_publish_total", result="failed")
+            logger.error("Заявка %s не опубликована за %s попыток: %s", external_id, attempts, error)
+            return
+        delay = min(PUBLISH_RETRY_MAX_DELAY, PUBLISH_RETRY_INTERVAL * 2 ** max(attempts - 1, 0))
+        self.queue.retry(item_id, delay, error)
+        metrics.inc("ati_publish_total", result="retry")
+        logger.warning("Публикация заявки %s отложена на %.0f с (попытка %s): %s", external_id, delay, attempts, error)
+
+    def close(self):
+        """Останавливает повторы и дожидается отправки уже взятых заявок."""
+        self._stop.set()
+        # Поток повторов может быть посреди dispatch_due: пул закрывается только после него
+        self._retry_thread.join()
+        self._executor.shutdown(wait=True)
+
+
+_publisher = None
+_publisher_lock = threading.Lock()
+
+def get_publisher():
+    """Общий Publisher процесса или None, если публикация выключена."""
+    global _publisher
+    if not PUBLISH_ENABLED:
+        return None
+    with _publisher_lock:
+        if _publisher is None:
+            _publisher = Publisher()
+    return _publisher
+
+def publish_requests(new_requests):
+    """Отдает новые заявки на публикацию в ATI, если она включена."""
+    publisher = get_publisher()
+    if publisher is not None and new_requests:
+        queued = publisher.submit(new_requests)
+        logger.info("Поставлено на публикацию в ATI: %s", queued)
+
+def close_publisher():
+    with _publisher_lock:
+        if _publisher is not None:
+            _publisher.close()
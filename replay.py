@@ -0,0 +1,115 @@
+# replay.py
+#
+# Прогон архива ответов BiddingsList (см. CAPTURE_DIR) через ту же обработку, что и живой опрос
+# (main.process_requests), без обращения к tms.ozon.ru. Запуск из корня проекта:
+#   python replay.py captures/                      # максимально быстро, геокодинг только из кэша
+#   python replay.py captures/20241010 --speed 10   # в 10 раз быстрее исходного темпа
+#   python replay.py captures/ --ati stub           # промахи кэша — в локальную заглушку ATI
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Воспроизведение архива ответов BiddingsList")
+    parser.add_argument("paths", nargs="+", help="снимки *.json / *.json.gz или каталоги с ними")
+    parser.add_argument("--speed", type=float, default=0,
+                        help="множитель темпа по меткам времени снимков (0 — без пауз)")
+    parser.add_argument("--ati", choices=("cache", "stub", "live"), default="cache",
+                        help="геокодинг: только кэш, заглушка ATI из benchmarks или настоящий ATI")
+    parser.add_argument("--state-dir", help="каталог для журналов и заявок прогона (по умолчанию временный)")
+    return parser.parse_args()
+
+
+def configure_environment(args):
+    """
+    Окружение прогона; задается до импорта config. Публикация в ATI выключена, файлы
+    состояния пишутся в отдельный каталог. Кэш геокодинга для cache и live — рабочий,
+    для stub — свой в каталоге прогона, чтобы ответы заглушки не попали в рабочий кэш.
+    Возвращает каталог прогона.
+    """
+    state_dir = os.path.abspath(args.state_dir or tempfile.mkdtemp(prefix="ozon_tms_replay_"))
+    os.makedirs(state_dir, exist_ok=True)
+    os.environ["PUBLISH_ENABLED"] = "0"
+    os.environ["CAPTURE_DIR"] = ""
+    if args.ati == "stub":
+        sys.path.insert(0, os.path.join(PROJECT_DIR, "benchmarks"))
+        from stub_servers import StubBackend, StubSettings, start_stub_server
+        _, _, ati_url = start_stub_server(StubBackend(StubSettings(ati_latency=0)))
+        os.environ["ATI_API_URL"] = ati_url
+        os.environ["GEOCODE_CACHE_FILE"] = os.path.join(state_dir, "geocode_cache.sqlite")
+    else:
+        os.environ["GEOCODE_CACHE_FILE"] = os.path.abspath(os.getenv("GEOCODE_CACHE_FILE", "geocode_cache.sqlite"))
+        if args.ati == "cache":
+            os.environ["GEOCODE_OFFLINE"] = "1"
+    return state_dir
+
+
+def replay(paths, speed=0):
+    """
+    Каждый снимок обрабатывается как отдельный опрос из одной страницы, в порядке имен.
+    При speed > 0 снимки подаются с исходными интервалами, ускоренными в speed раз.
+    Возвращает итоги прогона.
+    """
+    import main as app
+    from backfill import iter_archive_files, read_archive
+    from capture import capture_time
+    from logger import logger
+    from storage import ProcessedIdStore, request_sink
+
+    processed_ids = ProcessedIdStore()
+    totals = {"files": 0, "seen": 0, "new": 0, "changed": 0}
+    started = time.monotonic()
+    first_captured_at = None
+
+    for path in iter_archive_files(paths):
+        captured_at = capture_time(path)
+        if speed and captured_at is not None:
+            first_captured_at = first_captured_at or captured_at
+            delay = (captured_at - first_captured_at).total_seconds() / speed - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+        try:
+            page = read_archive(path)
+        except (OSError, ValueError) as e:
+            logger.error("Не удалось прочитать снимок %s: %s", path, e)
+            continue
+
+        summary = app.process_requests(None, None, processed_ids, pages=[page.lots])
+        totals["files"] += 1
+        for key in ("seen", "new", "changed"):
+            totals[key] += summary[key]
+
+    request_sink.close()
+    totals["elapsed"] = time.monotonic() - started
+    return totals
+
+
+def main():
+    args = parse_args()
+    paths = [os.path.abspath(path) for path in args.paths]
+    state_dir = configure_environment(args)
+    sys.path.insert(0, PROJECT_DIR)
+    os.chdir(state_dir)
+
+    totals = replay(paths, args.speed)
+
+    from geocode_cache import geocode_cache
+    elapsed = totals["elapsed"]
+    print(f"Каталог состояния:     {state_dir}")
+    print(f"Снимков:               {totals['files']}")
+    print(f"Лотов в снимках:       {totals['seen']}")
+    print(f"Новых / изменившихся:  {totals['new']} / {totals['changed']}")
+    print(f"Время:                 {elapsed:.1f} с")
+    print(f"Снимков/с:             {totals['files'] / elapsed if elapsed else 0:.1f}")
+    print(f"Лотов/с:               {totals['seen'] / elapsed if elapsed else 0:.1f}")
+    print(f"Кэш геокодинга:        {geocode_cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
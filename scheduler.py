@@ -0,0 +1,128 @@
+# scheduler.py
+
+import time
+from datetime import datetime, timezone
+from config import (
+    POLL_INTERVAL, POLL_MIN_INTERVAL, POLL_MAX_INTERVAL, POLL_TARGET_NEW_LOTS,
+    POLL_ERROR_BACKOFF_MAX, POLL_SHORT_AUCTION_FRACTION,
+)
+from logger import logger
+
+RATE_SMOOTHING = 0.3  # вес нового наблюдения в скользящем среднем темпа лотов
+
+
+def countdown_seconds(value, now=None):
+    """Приводит Auction.Countdown к секундам: число секунд или ISO-время окончания."""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        deadline = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if deadline.tzinfo is None:
+        deadline = deadline.replace(tzinfo=timezone.utc)
+    now = now or datetime.now(timezone.utc)
+    return (deadline - now).total_seconds()
+
+
+def auction_timing(lots):
+    """Минимальные Auction.Countdown и BiddingDurationSeconds среди лотов страницы."""
+    min_countdown = None
+    min_duration = None
+    for lot in lots:
+        countdown = countdown_seconds(lot.countdown)
+        if countdown is not None and countdown > 0 and (min_countdown is None or countdown < min_countdown):
+            min_countdown = countdown
+        duration = lot.bidding_duration
+        if duration and (min_duration is None or duration < min_duration):
+            min_duration = duration
+    return min_countdown, min_duration
+
+
+def new_poll_summary():
+    """Итоги одного опроса, по которым планировщик выбирает следующий интервал."""
+    return {
+        "worker": "default",
+        "ok": False,
+        "auth_failed": False,
+        "pages": 0,
+        "seen": 0,
+        "new": 0,
+        "changed": 0,
+        "duration": 0.0,
+        "min_countdown": None,
+        "min_bidding_duration": None,
+    }
+
+
+def merge_auction_timing(summary, lots):
+    """Добавляет в итоги опроса сроки аукционов из страницы лотов."""
+    min_countdown, min_duration = auction_timing(lots)
+    for key, value in (("min_countdown", min_countdown), ("min_bidding_duration", min_duration)):
+        if value is not None and (summary[key] is None or value < summary[key]):
+            summary[key] = value
+
+
+class PollScheduler:
+    """
+    Планировщик опросов с фиксированным шагом между стартами.
+    Интервал подстраивается под темп появления новых лотов, растет при ошибках
+    и сокращается, если в предыдущем ответе были короткие аукционы.
+    """
+
+    def __init__(self, interval=POLL_INTERVAL, min_interval=POLL_MIN_INTERVAL,
+                 max_interval=POLL_MAX_INTERVAL, target_new_lots=POLL_TARGET_NEW_LOTS):
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target_new_lots = target_new_lots
+        self.rate = None  # новых лотов в секунду, скользящее среднее
+        self.errors = 0
+        self._started = None
+        self._previous_started = None
+
+    def start_poll(self):
+        self._previous_started = self._started
+        self._started = time.monotonic()
+
+    def _clamp(self, value):
+        return max(self.min_interval, min(self.max_interval, value))
+
+    def _update_interval(self, summary):
+        if self._previous_started is None:
+            # Первый опрос видит весь накопленный список лотов, темп по нему не оцениваем
+            return
+        elapsed = max(self._started - self._previous_started, 1e-3)
+        sample = summary["new"] / elapsed
+        self.rate = sample if self.rate is None else RATE_SMOOTHING * sample + (1 - RATE_SMOOTHING) * self.rate
+        if self.rate > 0:
+            self.interval = self._clamp(self.target_new_lots / self.rate)
+        else:
+            self.interval = self._clamp(self.interval * 1.5)
+
+    def next_delay(self, summary):
+        """Возвращает паузу до следующего старта по итогам завершившегося опроса."""
+        if not summary["ok"]:
+            self.errors += 1
+            interval = min(POLL_ERROR_BACKOFF_MAX, self.interval * 2 ** self.errors)
+            logger.warning("Опрос завершился ошибкой (%s подряд). Следующий через %.0f с.", self.errors, interval)
+        else:
+            self.errors = 0
+            self._update_interval(summary)
+            interval = self.interval
+
+            # Короткие аукционы могут появиться и закрыться между двумя опросами
+            if summary["min_bidding_duration"]:
+                interval = min(interval, summary["min_bidding_duration"] * POLL_SHORT_AUCTION_FRACTION)
+            # К окончанию ближайшего аукциона список лотов меняется — просыпаемся к этому моменту
+            if summary["min_countdown"]:
+                interval = min(interval, summary["min_countdown"])
+            interval = max(self.min_interval, interval)
+
+        if self._started is None:
+            return interval
+        return max(0.0, self._started + interval - time.monotonic())
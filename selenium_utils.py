@@ -1,16 +1,18 @@
 # selenium_utils.py
 
 import json
+import os
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from config import CHROMEDRIVER_PATH, AUTH_URL, COOKIES_FILE
+from selenium.common.exceptions import TimeoutException
+from config import CHROMEDRIVER_PATH, AUTH_URL, COOKIES_FILE, BROWSER_LOGIN_TIMEOUT, SESSION_COOKIE_NAMES
 from logger import logger
 
-def get_cookies_from_selenium():
+def _create_driver():
     # Настройки для Selenium
     chrome_options = Options()
     chrome_options.add_argument("--headless")  # Запуск в фоновом режиме
@@ -19,32 +21,86 @@ def get_cookies_from_selenium():
 
     # Инициализация веб-драйвера
     service = Service(executable_path=CHROMEDRIVER_PATH)
-    driver = webdriver.Chrome(service=service, options=chrome_options)
+    return webdriver.Chrome(service=service, options=chrome_options)
 
-    # Открываем страницу авторизации
-    driver.get(AUTH_URL)
+def save_cookies(cookie_dict, path=COOKIES_FILE):
+    """Сохраняет куки в файл в формате, подходящем для requests."""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(cookie_dict, f, ensure_ascii=False, indent=4)
 
-    # Ожидаем, пока пользователь введет логин и пароль и нажмет кнопку входа
-    try:
-        # Ожидание элемента после успешной авторизации
-        WebDriverWait(driver, 60).until(
-            EC.presence_of_element_located((By.XPATH, "//selector_after_login"))  # Замените на правильный селектор
-        )
+def load_cookies_file(path=COOKIES_FILE):
+    """Читает куки из файла. None, если файла нет."""
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        cookies = json.load(f)
+    logger.info("Куки загружены из файла %s.", path)
+    return cookies
+
+def session_expiry(cookies, names=SESSION_COOKIE_NAMES):
+    """Ближайшее истечение куки авторизации (секунды epoch) из куки Selenium или None."""
+    expiries = [cookie["expiry"] for cookie in cookies if cookie.get("expiry") and cookie["name"] in names]
+    return min(expiries) if expiries else None
+
+class WarmBrowser:
+    """
+    Один экземпляр headless Chrome, который живет между обновлениями куки.
+    Холодный старт Chrome происходит только при первом обновлении или после сбоя драйвера.
+    """
+
+    def __init__(self, timeout=BROWSER_LOGIN_TIMEOUT, session_cookie_names=SESSION_COOKIE_NAMES):
+        self.timeout = timeout
+        self.session_cookie_names = session_cookie_names
+        self._driver = None
 
-        # Получаем куки
-        cookies = driver.get_cookies()
+    def fetch_cookies(self):
+        """
+        Открывает страницу авторизации в уже запущенном браузере и возвращает
+        (куки для requests, время истечения куки авторизации в секундах epoch или None).
+        """
+        if self._driver is None:
+            logger.info("Запуск Chrome для получения куки.")
+            self._driver = _create_driver()
+
+        try:
+            # Открываем страницу авторизации; в теплом браузере сессия уже есть и вход не нужен
+            self._driver.get(AUTH_URL)
+
+            # Ожидание элемента после успешной авторизации
+            WebDriverWait(self._driver, self.timeout).until(
+                EC.presence_of_element_located((By.XPATH, "//selector_after_login"))  # Замените на правильный селектор
+            )
+            cookies = self._driver.get_cookies()
+        except TimeoutException:
+            # Браузер исправен, просто вход не завершился: перезапуск Chrome тут не поможет
+            raise
+        except Exception:
+            # Драйвер мог упасть: следующий вызов начнет с чистого браузера
+            self.quit()
+            raise
 
         # Преобразуем куки в формат, подходящий для requests
         cookie_dict = {cookie['name']: cookie['value'] for cookie in cookies}
+        return cookie_dict, session_expiry(cookies, self.session_cookie_names)
 
-        # Сохраняем куки в файл
-        with open(COOKIES_FILE, "w", encoding="utf-8") as f:
-            json.dump(cookie_dict, f, ensure_ascii=False, indent=4)
+    def quit(self):
+        if self._driver is not None:
+            try:
+                self._driver.quit()  # Закрываем веб-драйвер
+            finally:
+                self._driver = None
 
+def get_cookies_from_selenium():
+    """Разовое получение куки в отдельном браузере с сохранением в файл."""
+    browser = WarmBrowser()
+    cookie_dict = {}
+    try:
+        cookie_dict, _ = browser.fetch_cookies()
+        save_cookies(cookie_dict)
         logger.info("Куки успешно получены и сохранены.")
     except Exception as e:
-        logger.error(f"Ошибка при получении куки: {e}")
+        logger.error("Ошибка при получении куки: %s", e)
     finally:
-        driver.quit()  # Закрываем веб-драйвер
+        browser.quit()
 
     return cookie_dict
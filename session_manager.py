@@ -0,0 +1,101 @@
+# session_manager.py
+
+import threading
+import time
+from config import COOKIES_FILE, SESSION_REFRESH_MARGIN, SESSION_MIN_REFRESH_INTERVAL, SESSION_REFRESH_BACKOFF_MAX
+from logger import logger
+from selenium_utils import WarmBrowser, load_cookies_file, save_cookies
+import metrics
+
+
+class SessionManager:
+    """
+    Держит куки в памяти между опросами и обновляет их только когда нужно:
+    заранее перед истечением куки авторизации или после отказа сервера в авторизации.
+    Обновление идет через один и тот же headless Chrome, который не закрывается между обновлениями.
+    Неудачное упреждающее обновление, пока текущие куки еще принимаются, повторяется
+    с растущей паузой, а не каждые min_refresh_interval.
+    """
+
+    def __init__(self, cookies_file=COOKIES_FILE, refresh_margin=SESSION_REFRESH_MARGIN,
+                 min_refresh_interval=SESSION_MIN_REFRESH_INTERVAL, refresh_backoff_max=SESSION_REFRESH_BACKOFF_MAX,
+                 browser=None):
+        self.cookies_file = cookies_file
+        self.refresh_margin = refresh_margin
+        self.min_refresh_interval = min_refresh_interval
+        self.refresh_backoff_max = refresh_backoff_max
+        self.browser = browser or WarmBrowser()
+        self.refreshes = 0
+        self._cookies = None
+        self._expires_at = None  # истечение куки авторизации по данным браузера, секунды epoch
+        self._last_refresh = None  # time.monotonic() последней попытки обновления
+        self._failures = 0  # неудачных обновлений подряд
+        self._file_loaded = False
+        self._lock = threading.Lock()
+
+    def _load_from_file(self):
+        # Файл читается один раз при старте; дальше куки живут в памяти
+        # Срок куки из файла неизвестен: они используются, пока сервер их принимает
+        self._file_loaded = True
+        cookies = load_cookies_file(self.cookies_file)
+        if cookies:
+            self._cookies = cookies
+
+    def _is_stale(self, now):
+        if self._cookies is None:
+            return True
+        return self._expires_at is not None and now >= self._expires_at - self.refresh_margin
+
+    def _can_refresh(self):
+        if self._last_refresh is None:
+            return True
+        interval = self.min_refresh_interval
+        if self._cookies is not None and self._failures:
+            # Текущие куки еще работают: упреждающее обновление не должно раз за разом блокировать опрос
+            interval = min(self.refresh_backoff_max, interval * 2 ** self._failures)
+        return time.monotonic() - self._last_refresh >= interval
+
+    def _refresh(self):
+        self._last_refresh = time.monotonic()
+        try:
+            with metrics.timer("session_refresh_seconds"):
+                cookies, expires_at = self.browser.fetch_cookies()
+        except Exception as e:
+            self._failures += 1
+            metrics.inc("session_refresh_total", result="error")
+            logger.error("Ошибка при получении куки (%s-я неудача подряд): %s", self._failures, e)
+            return
+        if not cookies:
+            self._failures += 1
+            metrics.inc("session_refresh_total", result="empty")
+            logger.error("Браузер не вернул куки.")
+            return
+        save_cookies(cookies, self.cookies_file)
+        self._cookies = cookies
+        self._expires_at = expires_at
+        self._failures = 0
+        self.refreshes += 1
+        metrics.inc("session_refresh_total", result="ok")
+        logger.info("Куки обновлены (%s-е обновление).", self.refreshes)
+
+    def get_cookies(self):
+        """Текущие куки. Обновляет их, если они устарели и с прошлой попытки прошло достаточно времени."""
+        with self._lock:
+            if not self._file_loaded:
+                self._load_from_file()
+            if self._is_stale(time.time()) and self._can_refresh():
+                self._refresh()
+            return self._cookies or {}
+
+    def invalidate(self):
+        """
+        Отмечает куки как отклоненные сервером.
+        Возвращает True, если обновление можно выполнить сразу и опрос стоит повторить без паузы.
+        """
+        with self._lock:
+            self._cookies = None
+            self._expires_at = None
+            return self._can_refresh()
+
+    def close(self):
+        self.browser.quit()
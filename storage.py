@@ -2,39 +2,641 @@
 
 import os
 import json
-from config import PROCESSED_IDS_FILE, ALL_REQUESTS_FILE
+import gzip
+import hashlib
+import heapq
+import shutil
+import sqlite3
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    PROCESSED_IDS_FILE, PROCESSED_IDS_LOG, PROCESSED_IDS_COMPACT_RATIO,
+    PROCESSED_IDS_RETENTION, PROCESSED_IDS_EXPIRE_INTERVAL,
+    REQUESTS_SINK_FILE, REQUESTS_SINK_MAX_BYTES, REQUESTS_SINK_MAX_AGE, REQUESTS_SINK_COMPRESSION,
+)
 from logger import logger
+from data_processing import dumps_request_body
+import metrics
 
-def load_processed_ids():
-    """Загружает список обработанных ID из файла."""
-    if os.path.exists(PROCESSED_IDS_FILE):
-        with open(PROCESSED_IDS_FILE, "r", encoding="utf-8") as f:
+try:
+    import zstandard
+except ImportError:  # сжатие zstd опционально
+    zstandard = None
+
+def load_processed_ids(path=PROCESSED_IDS_FILE):
+    """
+    Загружает список обработанных ID из JSON-файла прежнего формата.
+    Нужна только для переноса в журнал (ProcessedIdStore._migrate); новые ID пишутся в журнал.
+    """
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
             try:
                 processed_ids = set(json.load(f))
-                logger.info(f"Загружено {len(processed_ids)} обработанных ID.")
+                logger.info("Загружено %s обработанных ID из %s.", len(processed_ids), path)
                 return processed_ids
             except json.JSONDecodeError:
-                logger.error("Файл processed_ids.json поврежден. Создается новый файл.")
+                logger.error("Файл %s поврежден. Создается новый файл.", path)
                 return set()
     else:
-        logger.info("Файл processed_ids.json не найден. Создается новый файл.")
+        logger.info("Файл %s не найден. Создается новый файл.", path)
         return set()
 
-def save_processed_ids(processed_ids):
-    """Сохраняет список обработанных ID в файл."""
-    with open(PROCESSED_IDS_FILE, "w", encoding="utf-8") as f:
-        json.dump(list(processed_ids), f, ensure_ascii=False, indent=4)
-    logger.info(f"Сохранено {len(processed_ids)} обработанных ID.")
+def _fsync_dir(path):
+    """Сбрасывает на диск запись каталога после os.replace (на Windows не поддерживается)."""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+NO_VERSION = -(2 ** 63)  # версия лота неизвестна (ID записан до учета версий)
+
+def version_key(version):
+    """Lot.Version в виде int64 для индекса: целое как есть, иначе 63-битный хэш строки."""
+    if version is None:
+        return NO_VERSION
+    if isinstance(version, int) and not isinstance(version, bool) and NO_VERSION < version < 2 ** 63:
+        return version
+    digest = hashlib.blake2b(str(version).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") >> 1
+
+def _int_key(lot_id):
+    """Целочисленный ключ для компактного индекса или None, если ID не число."""
+    if isinstance(lot_id, int) and not isinstance(lot_id, bool):
+        return lot_id
+    if isinstance(lot_id, str) and lot_id.isdigit() and str(int(lot_id)) == lot_id:
+        return int(lot_id)
+    return None
+
+class SortedIdIndex:
+    """
+    Компактный индекс ID: параллельные отсортированные array('q') с ID, array('d')
+    со временем первого появления и array('q') с ключом версии (24 байта на ID).
+    Новые ID копятся в небольшом dict и периодически вливаются в массивы.
+    Нечисловые ID хранятся в обычном dict.
+    Не потокобезопасен: слияние и expire подменяют массивы и dict по очереди, поэтому
+    и чтение, и запись идут под блокировкой владельца (ProcessedIdStore._lock).
+    """
+
+    MERGE_THRESHOLD = 1024
+
+    def __init__(self):
+        self._ids = array("q")
+        self._seen = array("d")
+        self._versions = array("q")
+        self._recent = {}  # ключ -> [время первого появления, ключ версии]
+        self._other = {}
+
+    def _position(self, key):
+        i = bisect_left(self._ids, key)
+        return i if i < len(self._ids) and self._ids[i] == key else None
+
+    def __contains__(self, lot_id):
+        key = _int_key(lot_id)
+        if key is None:
+            return lot_id in self._other
+        return key in self._recent or self._position(key) is not None
+
+    def __len__(self):
+        return len(self._ids) + len(self._recent) + len(self._other)
+
+    def add(self, lot_id, first_seen, version=NO_VERSION):
+        """Добавляет ID. Возвращает False, если он уже был в индексе."""
+        if lot_id in self:
+            return False
+        key = _int_key(lot_id)
+        if key is None:
+            self._other[lot_id] = [first_seen, version]
+            return True
+        self._recent[key] = [first_seen, version]
+        if len(self._recent) >= self.MERGE_THRESHOLD:
+            self._merge()
+        return True
+
+    def get(self, lot_id):
+        """(время первого появления, ключ версии) или None, если ID нет в индексе."""
+        key = _int_key(lot_id)
+        entry = self._other.get(lot_id) if key is None else self._recent.get(key)
+        if entry is not None:
+            return tuple(entry)
+        if key is None:
+            return None
+        i = self._position(key)
+        return None if i is None else (self._seen[i], self._versions[i])
+
+    def set_version(self, lot_id, version):
+        """Обновляет ключ версии уже добавленного ID."""
+        key = _int_key(lot_id)
+        entry = self._other.get(lot_id) if key is None else self._recent.get(key)
+        if entry is not None:
+            entry[1] = version
+            return
+        i = None if key is None else self._position(key)
+        if i is not None:
+            self._versions[i] = version
+
+    def _merge(self):
+        merged = heapq.merge(
+            zip(self._ids, self._seen, self._versions),
+            sorted((key, first_seen, version) for key, (first_seen, version) in self._recent.items()),
+        )
+        ids, seen, versions = array("q"), array("d"), array("q")
+        for key, first_seen, version in merged:
+            ids.append(key)
+            seen.append(first_seen)
+            versions.append(version)
+        self._ids, self._seen, self._versions, self._recent = ids, seen, versions, {}
+
+    def items(self):
+        """Тройки (ID, время первого появления, ключ версии)."""
+        yield from zip(self._ids, self._seen, self._versions)
+        for key, (first_seen, version) in self._recent.items():
+            yield key, first_seen, version
+        for lot_id, (first_seen, version) in self._other.items():
+            yield lot_id, first_seen, version
+
+    def expire(self, cutoff):
+        """Удаляет ID, впервые замеченные раньше cutoff. Возвращает число удаленных."""
+        before = len(self)
+        self._merge()
+        ids, seen, versions = array("q"), array("d"), array("q")
+        for key, first_seen, version in zip(self._ids, self._seen, self._versions):
+            if first_seen >= cutoff:
+                ids.append(key)
+                seen.append(first_seen)
+                versions.append(version)
+        self._ids, self._seen, self._versions = ids, seen, versions
+        self._other = {lot_id: entry for lot_id, entry in self._other.items() if entry[0] >= cutoff}
+        return before - len(self)
+
+class ProcessedIdStore:
+    """
+    Обработанные ID в компактном индексе в памяти с журналом на диске.
+    Строка журнала — JSON-массив [ID, время первого появления, ключ версии]; ключ версии
+    может отсутствовать. Журнал читается один раз при старте, новые ID и смена версии
+    дописываются в конец с fsync, более поздняя строка ID перекрывает раннюю.
+    ID старше PROCESSED_IDS_RETENTION забываются: лот с таким ID уже не может оказаться в InBidding.
+    """
+
+    def __init__(self, path=PROCESSED_IDS_LOG, legacy_path=PROCESSED_IDS_FILE,
+                 retention=PROCESSED_IDS_RETENTION, label="обработанных"):
+        self.path = path
+        self.label = label  # для сообщений журнала: «обработанных», «опубликованных»
+        self.retention = retention
+        self._index = SortedIdIndex()
+        self._pending = []
+        self._log_lines = 0
+        self._last_expire = time.time()
+        self._lock = threading.Lock()
+        # Общий для воркеров: запись заявки и отметка ее ID, а также сброс на диск идут под ним
+        self.commit_lock = threading.RLock()
+        if os.path.exists(path):
+            self._load()
+        elif legacy_path and os.path.exists(legacy_path):
+            self._migrate(legacy_path)
+
+    def _load(self):
+        needs_compaction = False
+        now = time.time()
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                self._log_lines += 1
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Оборванная запись после падения процесса
+                    logger.warning("Пропущена поврежденная строка %s в %s.", self._log_lines, self.path)
+                    needs_compaction = True
+                    continue
+                if isinstance(record, list):
+                    version = record[2] if len(record) > 2 else NO_VERSION
+                    if not self._index.add(record[0], record[1], version):
+                        self._index.set_version(record[0], version)
+                else:
+                    # Строка без времени из журнала прежнего формата
+                    self._index.add(record, now)
+                    needs_compaction = True
+        logger.info("Загружено %s %s ID из %s.", len(self._index), self.label, self.path)
+        if self._index.expire(now - self.retention):
+            needs_compaction = True
+        if needs_compaction:
+            self.compact()
+
+    def _migrate(self, legacy_path):
+        """Переносит ID из legacy_path (JSON-список прежнего формата) в журнал. Старый файл не трогаем."""
+        now = time.time()
+        for lot_id in load_processed_ids(legacy_path):
+            self._index.add(lot_id, now)
+        self.compact()
+        logger.info("Перенесено %s ID из %s в %s.", len(self._index), legacy_path, self.path)
+
+    def __contains__(self, lot_id):
+        with self._lock:
+            return lot_id in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def __iter__(self):
+        with self._lock:
+            return iter([lot_id for lot_id, _, _ in self._index.items()])
+
+    def status(self, lot_id, version):
+        """
+        Сравнивает лот с индексом: "new", "changed" или "unchanged".
+        ID, записанный без версии, считается неизменившимся — его версию достаточно запомнить.
+        """
+        with self._lock:
+            entry = self._index.get(lot_id)
+        if entry is None:
+            return "new"
+        if entry[1] == NO_VERSION or entry[1] == version_key(version):
+            return "unchanged"
+        return "changed"
+
+    def add(self, lot_id, version=None):
+        """Запоминает ID и версию лота. Смена версии известного ID тоже попадает в журнал."""
+        key = version_key(version)
+        with self._lock:
+            entry = self._index.get(lot_id)
+            if entry is None:
+                first_seen = time.time()
+                self._index.add(lot_id, first_seen, key)
+            elif entry[1] != key and key != NO_VERSION:
+                first_seen = entry[0]
+                self._index.set_version(lot_id, key)
+            else:
+                return
+            self._pending.append((lot_id, first_seen, key))
+
+    def drain_pending(self):
+        """Забирает ID, добавленные после последней записи на диск."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        return pending
+
+    @metrics.timed("storage_flush_seconds", target="processed_ids")
+    def flush(self):
+        """Дописывает новые ID в журнал и сбрасывает их на диск."""
+        pending = self.drain_pending()
+        if pending:
+            with self._lock:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write("".join(_journal_line(*entry) for entry in pending))
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._log_lines += len(pending)
+            logger.info("Сохранено %s записей %s ID (всего ID %s).", len(pending), self.label, len(self._index))
+
+        if time.time() - self._last_expire >= PROCESSED_IDS_EXPIRE_INTERVAL:
+            self.expire()
+        elif self._log_lines > PROCESSED_IDS_COMPACT_RATIO * max(len(self._index), 1):
+            self.compact()
+
+    def expire(self):
+        """Забывает ID старше срока хранения и переписывает журнал, если что-то удалено."""
+        now = time.time()
+        with self._lock:
+            self._last_expire = now
+            removed = self._index.expire(now - self.retention)
+        if removed:
+            logger.info("Удалено %s устаревших %s ID.", removed, self.label)
+            self.compact()
 
-def save_all_requests_to_json(all_requests):
-    """Сохраняет все заявки в JSON файл."""
-    with open(ALL_REQUESTS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(all_requests, f, ensure_ascii=False, indent=4)
-    logger.info(f"Все заявки сохранены в файл: {ALL_REQUESTS_FILE}")
+    def compact(self):
+        """Переписывает журнал по текущему индексу: временный файл, fsync и атомарная замена."""
+        tmp_path = self.path + ".tmp"
+        with self._lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write("".join(_journal_line(*entry) for entry in self._index.items()))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            _fsync_dir(self.path)
+            self._log_lines = len(self._index)
+
+def _journal_line(lot_id, first_seen, version=NO_VERSION):
+    record = [lot_id, round(first_seen, 3)]
+    if version != NO_VERSION:
+        record.append(version)
+    return json.dumps(record, ensure_ascii=False) + "\n"
+
+class JsonlSink:
+    """
+    Потоковая запись заявок: одна компактная JSON-строка на заявку в активный сегмент.
+    Сегмент ротируется по размеру или возрасту; закрытый сегмент переименовывается
+    с меткой времени и при необходимости сжимается в фоновом потоке, чтобы запись
+    не ждала сжатия. Готовый файл появляется под итоговым именем только целиком
+    (запись во временный файл и os.replace).
+    """
+
+    def __init__(self, path=REQUESTS_SINK_FILE, max_bytes=REQUESTS_SINK_MAX_BYTES,
+                 max_age=REQUESTS_SINK_MAX_AGE, compression=REQUESTS_SINK_COMPRESSION):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.compression = compression
+        self._file = None
+        self._opened_at = None
+        self._dirty = False  # есть строки, еще не сброшенные на диск
+        self._lock = threading.Lock()
+        self._compressor = None  # один поток на все закрытые сегменты, создается при первой ротации
+
+    def _open(self):
+        self._file = open(self.path, "ab")
+        self._opened_at = time.time()
+
+    def _should_rotate(self):
+        if self._file is None:
+            return False
+        if self.max_bytes and self._file.tell() >= self.max_bytes:
+            return True
+        return bool(self.max_age) and time.time() - self._opened_at >= self.max_age
+
+    @metrics.timed("storage_write_seconds", target="requests")
+    def write(self, request_body):
+        """Дописывает заявку в активный сегмент (без fsync, см. flush)."""
+        self.write_line(dumps_request_body(request_body))
+
+    def write_line(self, line):
+        """Дописывает уже сериализованную заявку (байты без перевода строки)."""
+        line += b"\n"
+        with self._lock:
+            if self._should_rotate():
+                self._rotate()
+            if self._file is None:
+                self._open()
+            self._file.write(line)
+            self._dirty = True
+
+    @metrics.timed("storage_flush_seconds", target="requests")
+    def flush(self):
+        """Сбрасывает активный сегмент на диск."""
+        with self._lock:
+            if self._file is None or not self._dirty:
+                return
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._dirty = False
+            if self._should_rotate():
+                self._rotate()
+
+    def close(self):
+        """Закрывает активный сегмент и дожидается сжатия уже закрытых."""
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+                self._dirty = False
+            compressor, self._compressor = self._compressor, None
+        if compressor is not None:
+            compressor.shutdown(wait=True)
+
+    def _rotate(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        self._dirty = False
+
+        root, ext = os.path.splitext(self.path)
+        stamp = time.strftime('%Y%m%dT%H%M%S')
+        segment = f"{root}-{stamp}{ext}"
+        suffix = 1
+        while any(os.path.exists(segment + tail) for tail in ("", ".gz", ".zst")):
+            segment = f"{root}-{stamp}-{suffix}{ext}"
+            suffix += 1
+        os.replace(self.path, segment)
+        _fsync_dir(self.path)
+        logger.info("Сегмент заявок закрыт: %s", segment)
+        if self.compression:
+            if self._compressor is None:
+                self._compressor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="requests-compress")
+            self._compressor.submit(self._compress, segment)
+
+    def _compress(self, segment):
+        try:
+            with metrics.timer("storage_compress_seconds", target="requests"):
+                target = _compress_segment(segment, self.compression)
+        except OSError as e:
+            logger.error("Не удалось сжать сегмент заявок %s: %s", segment, e)
+            return
+        logger.info("Сегмент заявок сжат: %s", target)
+
+def _compress_segment(segment, compression):
+    """Сжимает закрытый сегмент через временный файл. Возвращает путь итогового файла."""
+    if compression == "zstd":
+        if zstandard is None:
+            logger.warning("Модуль zstandard не установлен, сегмент сжимается gzip.")
+            compression = "gzip"
+        else:
+            target = segment + ".zst"
+            with open(segment, "rb") as src, open(target + ".tmp", "wb") as dst:
+                zstandard.ZstdCompressor().copy_stream(src, dst)
+                dst.flush()
+                os.fsync(dst.fileno())
+    if compression == "gzip":
+        target = segment + ".gz"
+        with open(segment, "rb") as src, open(target + ".tmp", "wb") as dst:
+            with gzip.GzipFile(fileobj=dst, mode="wb", compresslevel=6) as gz:
+                shutil.copyfileobj(src, gz)
+            dst.flush()
+            os.fsync(dst.fileno())
+    elif compression != "zstd":
+        logger.warning("Неизвестный тип сжатия %r, сегмент оставлен как есть.", compression)
+        return segment
+    os.replace(target + ".tmp", target)
+    _fsync_dir(target)
+    os.remove(segment)
+    return target
+
+request_sink = JsonlSink()
+
+def commit_lot_request(record, lot_id, version, processed_ids):
+    """
+    Дописывает заявку в request_sink и отмечает лот обработанным.
+    Возвращает False, если эту версию лота уже записал другой воркер.
+    """
+    with processed_ids.commit_lock:
+        if processed_ids.status(lot_id, version) == "unchanged":
+            return False
+        request_sink.write(record)
+        processed_ids.add(lot_id, version)
+    return True
+
+def save_new_requests(new_requests, processed_ids):
+    """
+    Фиксирует итог опроса: заявки, уже дописанные в request_sink, сбрасываются на диск,
+    затем в хранилище обработанных дописываются их ID.
+    """
+    with processed_ids.commit_lock:
+        # Сбрасываем и строки других воркеров: их ID могут оказаться в этом же сбросе журнала
+        request_sink.flush()
+        if new_requests:
+            logger.info("Заявок записано в %s: %s", REQUESTS_SINK_FILE, len(new_requests))
+        else:
+            logger.info("Нет новых заявок для обработки.")
+        # Версии уже известных лотов запоминаются и без новых заявок
+        processed_ids.flush()
 
 def save_request_body_to_json(request_body, lot_id):
     """Сохраняет одну заявку в отдельный JSON файл."""
     filename = f"request_body_{lot_id}.json"
     with open(filename, 'w', encoding='utf-8') as f:
         json.dump(request_body, f, ensure_ascii=False, indent=4)
-    logger.info(f"Запрос сохранен в файл: {filename}")
+    logger.info("Запрос сохранен в файл: %s", filename)
+
+class DurableQueue:
+    """
+    Очередь задач поверх SQLite (WAL), переживающая перезапуск процесса.
+    Задача уникальна по ключу. Взятая задача «арендуется» до available_at (статус leased):
+    если обработчик не подтвердил ее (ack), не отложил (retry) и не отбросил (fail), после
+    истечения аренды она снова станет доступной. Аренды прошлого процесса снимает release_leases.
+    """
+
+    def __init__(self, path, name="queue"):
+        self.path = path
+        self.name = name
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"""CREATE TABLE IF NOT EXISTS {name} (
+                id INTEGER PRIMARY KEY,
+                key TEXT NOT NULL UNIQUE,
+                payload BLOB NOT NULL,
+                status TEXT NOT NULL DEFAULT 'ready',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL,
+                last_error TEXT,
+                created_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {name}_ready ON {name} (status, available_at)")
+        self._conn.commit()
+
+    def put_many(self, items, lease=None):
+        """
+        Добавляет задачи [(ключ, payload)]; payload сериализуется как тело заявки.
+        Задачи с ключом, который уже ждет в очереди, пропускаются; отброшенная (fail) задача
+        с тем же ключом возвращается в очередь с новым payload и обнуленными попытками.
+        Если задан lease, новые задачи сразу считаются взятыми на столько секунд.
+        Возвращает [(id, ключ, payload)] добавленных.
+        """
+        now = time.time()
+        added = []
+        with self._lock:
+            for key, payload in items:
+                values = (dumps_request_body(payload), "ready" if lease is None else "leased",
+                          int(lease is not None), now + (lease or 0), now)
+                cursor = self._conn.execute(
+                    f"INSERT OR IGNORE INTO {self.name} (payload, status, attempts, available_at, created_at, key) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (*values, str(key)),
+                )
+                if cursor.rowcount:
+                    added.append((cursor.lastrowid, key, payload))
+                    continue
+                cursor = self._conn.execute(
+                    f"UPDATE {self.name} SET payload = ?, status = ?, attempts = ?, available_at = ?, "
+                    "created_at = ?, last_error = NULL WHERE key = ? AND status = 'dead'",
+                    (*values, str(key)),
+                )
+                if cursor.rowcount:
+                    row = self._conn.execute(f"SELECT id FROM {self.name} WHERE key = ?", (str(key),)).fetchone()
+                    added.append((row[0], key, payload))
+            self._conn.commit()
+        return added
+
+    def claim(self, limit, lease, exclude=()):
+        """
+        Берет до limit готовых задач на lease секунд, кроме задач с ключами из exclude
+        (например, еще выполняющихся после истечения аренды). Возвращает [(id, ключ, payload)].
+        """
+        now = time.time()
+        exclude = [str(key) for key in exclude]
+        not_in = f"AND key NOT IN ({','.join('?' * len(exclude))}) " if exclude else ""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, key, payload FROM {self.name} "
+                "WHERE status IN ('ready', 'leased') AND available_at <= ? "
+                f"{not_in}ORDER BY available_at LIMIT ?",
+                (now, *exclude, limit),
+            ).fetchall()
+            if rows:
+                self._conn.executemany(
+                    f"UPDATE {self.name} SET status = 'leased', available_at = ?, attempts = attempts + 1 "
+                    "WHERE id = ?",
+                    [(now + lease, row[0]) for row in rows],
+                )
+                self._conn.commit()
+        return [(row_id, key, json.loads(payload)) for row_id, key, payload in rows]
+
+    def release_leases(self):
+        """
+        Возвращает в очередь задачи, взятые прошлым процессом и не завершенные им.
+        Вызывается при старте владельцем файла очереди, пока задачи еще никто не взял.
+        Возвращает число освобожденных задач.
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                f"UPDATE {self.name} SET status = 'ready', available_at = ? WHERE status = 'leased'", (time.time(),)
+            )
+            self._conn.commit()
+        if cursor.rowcount:
+            logger.info("Очередь %s: возвращено незавершенных задач прошлого запуска: %s", self.name, cursor.rowcount)
+        return cursor.rowcount
+
+    def pending_keys(self, keys):
+        """Подмножество keys, задачи с которыми еще есть в очереди."""
+        keys = [str(key) for key in keys]
+        if not keys:
+            return set()
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT key FROM {self.name} WHERE key IN ({','.join('?' * len(keys))})", keys
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def attempts(self, item_id):
+        with self._lock:
+            row = self._conn.execute(f"SELECT attempts FROM {self.name} WHERE id = ?", (item_id,)).fetchone()
+        return row[0] if row else 0
+
+    def ack(self, item_id):
+        """Задача выполнена и удаляется из очереди."""
+        self.ack_many([item_id])
+
+    def ack_many(self, item_ids):
+        with self._lock:
+            self._conn.executemany(f"DELETE FROM {self.name} WHERE id = ?", [(item_id,) for item_id in item_ids])
+            self._conn.commit()
+
+    def retry(self, item_id, delay, error=None):
+        """Откладывает задачу на delay секунд."""
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE {self.name} SET status = 'ready', available_at = ?, last_error = ? WHERE id = ?",
+                (time.time() + delay, error, item_id),
+            )
+            self._conn.commit()
+
+    def fail(self, item_id, error=None):
+        """Задача не будет повторяться; остается в таблице для разбора."""
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE {self.name} SET status = 'dead', last_error = ? WHERE id = ?", (error, item_id)
+            )
+            self._conn.commit()
+
+    def stats(self):
+        """Число задач по статусам."""
+        with self._lock:
+            return dict(self._conn.execute(f"SELECT status, COUNT(*) FROM {self.name} GROUP BY status").fetchall())
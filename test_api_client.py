@@ -0,0 +1,52 @@
+# test_api_client.py
+#
+# Разбор ответа BiddingsList: python -m pytest -q test_api_client.py
+
+import io
+import os
+import pytest
+import requests
+import api_client
+from capture import ResponseCapture
+
+LOTS_BODY = b'{"data": {"Lots": [{"ID": 1, "Version": 2}, {"ID": 3, "Version": 4}]}}'
+
+
+def make_response(body, status_code=200):
+    response = requests.Response()
+    response.status_code = status_code
+    response.raw = io.BytesIO(body)
+    return response
+
+
+def captured_files(directory):
+    return [name for _, _, names in os.walk(directory) for name in names]
+
+
+@pytest.fixture
+def capture_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(api_client, "response_capture", ResponseCapture(str(tmp_path)))
+    return tmp_path
+
+
+def test_stream_truncated_body_with_capture(capture_dir):
+    pytest.importorskip("ijson")
+    page = api_client.decode_lots_response(make_response(LOTS_BODY[:40]), decoder="stream")
+    assert page is None
+    assert captured_files(capture_dir) == []
+
+
+def test_stream_body_with_capture(capture_dir):
+    pytest.importorskip("ijson")
+    page = api_client.decode_lots_response(make_response(LOTS_BODY), decoder="stream")
+    assert [(lot.id, lot.version) for lot in page.lots] == [(1, 2), (3, 4)]
+    assert len(captured_files(capture_dir)) == 1
+
+
+def test_worker_filter_does_not_override_paging():
+    lots_filter = api_client.lots_filter_input(
+        offset=80, limit=40, overrides={"Limit": 10, "Offset": 0, "RoutesFilter": {"StartClusters": ["Москва"]}}
+    )
+    assert (lots_filter["Limit"], lots_filter["Offset"]) == (40, 80)
+    assert lots_filter["RoutesFilter"]["StartClusters"] == ["Москва"]
+    assert lots_filter["RoutesFilter"]["EndClusters"] == []
@@ -0,0 +1,140 @@
+# test_storage.py
+#
+# Журнал обработанных ID: python -m pytest -q test_storage.py
+
+import json
+import threading
+import time
+import pytest
+from storage import ProcessedIdStore, SortedIdIndex
+
+
+@pytest.fixture
+def small_merge(monkeypatch):
+    """Маленький порог слияния, чтобы ID попадали и в массивы, и в dict новых."""
+    monkeypatch.setattr(SortedIdIndex, "MERGE_THRESHOLD", 4)
+
+
+def write_journal(path, records, tail=""):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("".join(json.dumps(record) + "\n" for record in records) + tail)
+
+
+def read_journal(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_reload_after_torn_last_line(tmp_path, small_merge):
+    path = str(tmp_path / "ids.log")
+    now = time.time()
+    write_journal(path, [[lot_id, now] for lot_id in range(1, 7)], tail='[7, 17')
+
+    store = ProcessedIdStore(path, legacy_path=None)
+    assert sorted(store) == [1, 2, 3, 4, 5, 6]
+    assert 7 not in store
+    # Журнал переписан без оборванной строки, новая запись не склеивается с ней
+    assert len(read_journal(path)) == 6
+
+    store.add(8, "v1")
+    store.flush()
+    reloaded = ProcessedIdStore(path, legacy_path=None)
+    assert sorted(reloaded) == [1, 2, 3, 4, 5, 6, 8]
+    assert reloaded.status(8, "v1") == "unchanged"
+
+
+def test_expire_then_compact_keeps_ids_after_reload(tmp_path, small_merge):
+    path = str(tmp_path / "ids.log")
+    now = time.time()
+    old, fresh = [1, 3, 5, "old"], [2, 4, 6, 8, 10, "fresh"]
+    write_journal(path, [[lot_id, now - 1000, 1] for lot_id in old] + [[lot_id, now, 2] for lot_id in fresh])
+
+    store = ProcessedIdStore(path, legacy_path=None, retention=10_000)
+    assert len(store) == len(old) + len(fresh)
+    store.add(12, 3)
+    store.retention = 100
+    store.expire()
+
+    expected = sorted(map(str, fresh + [12]))
+    assert sorted(map(str, store)) == expected
+    assert len(read_journal(path)) == len(expected)
+
+    reloaded = ProcessedIdStore(path, legacy_path=None, retention=100)
+    assert sorted(map(str, reloaded)) == expected
+    for lot_id in old:
+        assert reloaded.status(lot_id, 1) == "new"
+    for lot_id in fresh:
+        assert reloaded.status(lot_id, 2) == "unchanged"
+    assert reloaded.status(12, 3) == "unchanged"
+
+
+@pytest.mark.parametrize("lot_id, first, second", [
+    (101, 1, 2),
+    ("a-101", "2024-10-10T06:00:00Z", "2024-10-10T07:00:00Z"),
+])
+def test_version_change_is_changed_and_survives_reload(tmp_path, lot_id, first, second):
+    path = str(tmp_path / "ids.log")
+    store = ProcessedIdStore(path, legacy_path=None)
+    assert store.status(lot_id, first) == "new"
+    store.add(lot_id, first)
+    store.flush()
+    assert store.status(lot_id, first) == "unchanged"
+    assert store.status(lot_id, second) == "changed"
+
+    store.add(lot_id, second)
+    store.flush()
+    # Смена версии дописана отдельной строкой с прежним временем первого появления
+    lines = read_journal(path)
+    assert len(lines) == 2 and lines[0][1] == lines[1][1]
+
+    reloaded = ProcessedIdStore(path, legacy_path=None)
+    assert len(reloaded) == 1
+    assert reloaded.status(lot_id, second) == "unchanged"
+    assert reloaded.status(lot_id, first) == "changed"
+
+
+def test_migrate_from_legacy_json(tmp_path):
+    path = str(tmp_path / "ids.log")
+    legacy_path = tmp_path / "legacy_ids.json"
+    legacy_path.write_text(json.dumps([1, 2, "abc"]), encoding="utf-8")
+
+    store = ProcessedIdStore(path, legacy_path=str(legacy_path))
+    assert sorted(map(str, store)) == ["1", "2", "abc"]
+    # ID без версии из старого файла: версия лота просто запоминается
+    assert store.status(1, 5) == "unchanged"
+    assert json.loads(legacy_path.read_text(encoding="utf-8")) == [1, 2, "abc"]
+
+    reloaded = ProcessedIdStore(path, legacy_path=None)
+    assert sorted(map(str, reloaded)) == ["1", "2", "abc"]
+
+
+def test_reads_during_merge_and_expire(tmp_path, small_merge):
+    path = str(tmp_path / "ids.log")
+    store = ProcessedIdStore(path, legacy_path=None)
+    known = list(range(0, 2000, 2))
+    for lot_id in known:
+        store.add(lot_id, lot_id)
+    errors = []
+    stop = threading.Event()
+
+    def read():
+        try:
+            while not stop.is_set():
+                for lot_id in known[::37]:
+                    assert lot_id in store
+                    assert store.status(lot_id, lot_id) == "unchanged"
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    # Нечетные ID вливаются в массивы пачками, expire каждый раз пересобирает их
+    for lot_id in range(1, 4001, 2):
+        store.add(lot_id, 1)
+        if lot_id % 200 == 1:
+            store.expire()
+    stop.set()
+    for reader in readers:
+        reader.join()
+    assert errors == []
@@ -0,0 +1,132 @@
+# transport_types.py
+
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from dataclasses import dataclass, asdict, fields
+from config import TRANSPORT_TYPES_FILE, DEFAULT_CARGO_NAME
+from logger import logger
+
+_WEIGHT_RE = re.compile(r"(\d+(?:[.,]\d+)?)\s*т")
+_VOLUME_RE = re.compile(r"(\d+(?:[.,]\d+)?)\s*м3")
+
+
+def _number(value):
+    """Число из строки с точкой или запятой; целое, если дробной части нет. None, если не число."""
+    try:
+        number = float(str(value).replace(",", "."))
+    except ValueError:
+        return None
+    return int(number) if number.is_integer() else number
+
+
+def parse_transport_type(name, capacity):
+    """Вес (т) и объем (м3) из TransportType.Name вида "20т 82м3" и Capacity вида "82.0"."""
+    match = _WEIGHT_RE.search(name or "")
+    weight = _number(match.group(1)) if match else None
+    volume = _number(capacity) if capacity else None
+    if volume is None:
+        match = _VOLUME_RE.search(name or "")
+        volume = _number(match.group(1)) if match else None
+    return weight, volume
+
+
+@dataclass(slots=True)
+class TransportSpec:
+    """Груз для заявки ATI по типу транспорта Ozon."""
+
+    name: str = ""
+    capacity: str = ""
+    weight: object = None
+    volume: object = None
+    cargo_name: str = DEFAULT_CARGO_NAME
+
+
+_SPEC_FIELDS = tuple(spec_field.name for spec_field in fields(TransportSpec))
+
+
+class TransportTypeRegistry:
+    """
+    Справочник TransportType.ID -> TransportSpec. Новый тип разбирается при первой встрече
+    и сохраняется в JSON-файл; записи файла можно править вручную (вес, объем, cargo_name),
+    они имеют приоритет над разбором названия. Без ID тип разбирается каждый раз и не сохраняется.
+    """
+
+    def __init__(self, path=TRANSPORT_TYPES_FILE, persist=True):
+        self.path = path
+        self.persist = persist
+        self._specs = {}
+        # Записи файла как есть: при сохранении дописываются только новые типы, чужие ключи сохраняются
+        self._entries = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        """
+        Читает справочник. Неизвестные ключи и не-объекты при разборе пропускаются, но остаются
+        в файле. Если файл не читается, он копируется в резервный, а сохранение выключается,
+        чтобы не затереть ручные правки.
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            if not isinstance(entries, dict):
+                raise ValueError("ожидается JSON-объект {TransportType.ID: запись}")
+            specs = {}
+            for type_id, entry in entries.items():
+                if not isinstance(entry, dict):
+                    logger.warning("Пропущена запись %s в %s: ожидается объект.", type_id, self.path)
+                    continue
+                specs[str(type_id)] = TransportSpec(**{key: entry[key] for key in _SPEC_FIELDS if key in entry})
+        except (OSError, ValueError) as e:
+            self.persist = False
+            backup_path = f"{self.path}.{time.strftime('%Y%m%dT%H%M%S')}.bak"
+            try:
+                shutil.copy2(self.path, backup_path)
+            except OSError:
+                backup_path = None
+            logger.error("Не удалось загрузить справочник типов транспорта %s: %s. Файл не будет перезаписан "
+                         "до исправления (копия: %s).", self.path, e, backup_path)
+            return
+        self._specs = specs
+        self._entries = entries
+        logger.info("Загружено типов транспорта из %s: %s", self.path, len(self._specs))
+
+    def _save(self):
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error("Не удалось сохранить справочник типов транспорта %s: %s", self.path, e)
+
+    def lookup(self, type_id, name="", capacity=""):
+        """TransportSpec для типа транспорта лота."""
+        if type_id is None:
+            return TransportSpec(name, capacity, *parse_transport_type(name, capacity))
+        key = str(type_id)
+        spec = self._specs.get(key)
+        if spec is not None:
+            return spec
+
+        with self._lock:
+            spec = self._specs.get(key)
+            if spec is None:
+                spec = self._specs[key] = TransportSpec(name, capacity, *parse_transport_type(name, capacity))
+                self._entries[key] = asdict(spec)
+                logger.info("Новый тип транспорта %s (%s): вес %s т, объем %s м3.",
+                            type_id, name, spec.weight, spec.volume)
+                if self.persist:
+                    self._save()
+        return spec
+
+    def __len__(self):
+        return len(self._specs)
+
+
+transport_types = TransportTypeRegistry()
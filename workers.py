@@ -0,0 +1,42 @@
+# workers.py
+
+import json
+import os
+from config import WORKERS_FILE, COOKIES_FILE
+from logger import logger
+
+
+def default_worker():
+    """Единственный воркер с фильтром по умолчанию, как до появления WORKERS_FILE."""
+    return {"name": "default", "cookies_file": COOKIES_FILE, "filter": {}}
+
+
+def load_workers(path=WORKERS_FILE):
+    """
+    Читает конфигурации воркеров опроса. Файл — JSON-список объектов:
+    {"name": "...", "cookies_file": "...", "filter": {поля LotsInput}}.
+    Без файла работает один воркер по умолчанию.
+    """
+    if not os.path.exists(path):
+        return [default_worker()]
+    with open(path, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+
+    workers = []
+    for index, entry in enumerate(entries):
+        worker = default_worker()
+        worker["name"] = f"worker-{index + 1}"
+        worker.update(entry)
+        paging = sorted({"Limit", "Offset"} & set(worker.get("filter") or {}))
+        if paging:
+            logger.warning("Воркер %s: %s в фильтре игнорируются, страницы задает выборка.",
+                           worker["name"], ", ".join(paging))
+        workers.append(worker)
+    if not workers:
+        return [default_worker()]
+
+    names = [worker["name"] for worker in workers]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Имена воркеров в {path} должны быть уникальными: {names}")
+    logger.info("Загружено воркеров опроса из %s: %s", path, ", ".join(names))
+    return workers